@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class PermatrixConfig(AppConfig):
+    name = "permatrix"
+    default_auto_field = "django.db.models.AutoField"
+
+    def ready(self):
+        # Connected here rather than in models so that receivers run after
+        # the auth and contenttypes post_migrate handlers have created rows
+        from permatrix import signals  # noqa
@@ -0,0 +1,117 @@
+from asgiref.sync import sync_to_async
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponseNotModified, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils.http import parse_etags
+from django.utils.safestring import mark_safe
+from django.views.generic import View
+
+import asyncio
+
+from permatrix.models import PermissionChange
+from permatrix.views import PermissionMatrixView, STREAM_MARKER
+
+
+class AsyncPermissionMatrixView(PermissionMatrixView):
+    """
+    Read only matrix view for ASGI deployments, built with the async ORM.
+    The permission columns, journal position and visible groups are read
+    first, one query after another as the async ORM runs them on the same
+    thread sensitive executor, then the page is streamed with group rows sent
+    as they are read from an async membership cursor, so a large matrix does
+    not hold a worker thread while it is built. Route it in place of
+    PermissionMatrixView and keep the sync view for changes, which this view
+    does not accept.
+
+    Query counts are not instrumented, as async ORM queries run on another
+    thread to the one the counters are installed on
+    """
+    http_method_names = ["get", "head", "options"]
+    streaming = True
+    client_render = False
+    instrument = False
+
+    async def dispatch(self, request, *args, **kwargs):
+        # The user is loaded from the session on first use, which queries
+        if not await sync_to_async(self.has_access)(request):
+            raise PermissionDenied
+        response = await View.dispatch(self, request, *args, **kwargs)
+        if self.timer.phases:
+            response["Server-Timing"] = self.timer.server_timing()
+        return response
+
+    async def get(self, request):
+        self.read_filters(request)
+        etag = await sync_to_async(self.get_etag)(request)
+        if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+        if etag and if_none_match and (if_none_match.strip() == "*" or etag in parse_etags(if_none_match)):
+            response = HttpResponseNotModified()
+        else:
+            response = await self.render_matrix(request)
+        if etag:
+            response["ETag"] = etag
+        return response
+
+    async def get_group_list(self):
+        return [group async for group in self.get_groups()]
+
+    async def render_matrix(self, request):
+        self.change_seq, self.columns, groups = await asyncio.gather(
+            self.using(PermissionChange.objects.order_by("-pk")).values_list("pk", flat=True).afirst(),
+            sync_to_async(self.get_columns)(),
+            self.get_group_list(),
+        )
+        self.change_seq = self.change_seq or 0
+        page = await sync_to_async(render_to_string)(
+            self.template_name, self.get_context_data(stream_marker=mark_safe(STREAM_MARKER)), request=request
+        )
+        head, tail = page.split(STREAM_MARKER, 1)
+        return StreamingHttpResponse(self.iter_page(head, groups, tail))
+
+    async def iter_page(self, head, groups, tail):
+        yield head
+        async for html in self.iter_rows_async(groups):
+            yield html
+        yield tail
+
+    async def iter_memberships_async(self, groups):
+        """
+        Yield each group with the ids of its permissions, merging the group
+        list with an ordered async cursor over the memberships
+        """
+        group_ids = [g.pk for g in groups] if self.windowed else None
+        # values() rather than values_list(), whose aiterator() opens its
+        # cursor on the event loop thread
+        memberships = self.get_membership_queryset(group_ids).order_by(
+            "group__name", "group_id"
+        ).values("group_id", "permission_id").aiterator()
+        pending = await anext_or_none(memberships)
+        for g in groups:
+            permission_ids = []
+            while pending is not None and pending["group_id"] == g.pk:
+                permission_ids.append(pending["permission_id"])
+                pending = await anext_or_none(memberships)
+            yield g, permission_ids
+
+    async def iter_rows_async(self, groups):
+        """
+        Yield rendered group rows a chunk at a time, rendering each chunk off
+        the event loop as its memberships arrive
+        """
+        render_chunk = sync_to_async(self.render_chunk)
+        chunk = []
+        async for g, permission_ids in self.iter_memberships_async(groups):
+            chunk.append((g, permission_ids))
+            if len(chunk) >= self.stream_chunk_size:
+                for html in await render_chunk(chunk):
+                    yield html
+                chunk = []
+        for html in await render_chunk(chunk):
+            yield html
+
+
+async def anext_or_none(iterator):
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return None
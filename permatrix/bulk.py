@@ -0,0 +1,273 @@
+from django.contrib.auth.models import Group, Permission
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+import csv
+import json
+
+from permatrix.cache import groups_changed
+from permatrix.signals import permissions_changed
+
+ACTIONS = ("add", "remove")
+
+
+class PermissionChangeSet(object):
+    """
+    Validate and apply a batch of group permission changes together. Each item
+    is a dict with group, permission and action keys, as for
+    GroupPermissionForm, but the whole batch is checked and written with a
+    fixed number of queries per batch of changes
+    """
+    batch_size = 1000
+    # Rows looked up or deleted per query, within the bound variable limits
+    # of all backends
+    delete_batch_size = 500
+
+    def __init__(self, data):
+        self.data = data
+        self.errors = {}
+        self.changes = []
+        self.existing = {}
+
+    def add_error(self, index, message):
+        self.errors.setdefault(index, []).append(message)
+
+    def is_valid(self):
+        self.full_clean()
+        return not self.errors
+
+    def parse(self):
+        items = []
+        for index, item in enumerate(self.data):
+            try:
+                group_id = int(item["group"])
+                permission_id = int(item["permission"])
+                action = item["action"]
+            except (KeyError, TypeError, ValueError):
+                self.add_error(index, "Change must have an integer group and permission and an action")
+                continue
+            if action not in ACTIONS:
+                self.add_error(index, "Select a valid choice. {} is not one of the available choices.".format(action))
+                continue
+            items.append((index, group_id, permission_id, action))
+        return items
+
+    def full_clean(self):
+        self.errors = {}
+        self.changes = []
+        items = self.parse()
+        if not items:
+            return
+        group_ids = {item[1] for item in items}
+        permission_ids = {item[2] for item in items}
+        groups = set(Group.objects.filter(pk__in=group_ids).values_list("pk", flat=True))
+        permissions = set(Permission.objects.filter(pk__in=permission_ids).values_list("pk", flat=True))
+        existing = self.existing = self.get_existing(
+            {(item[1], item[2]) for item in items if item[1] in groups and item[2] in permissions})
+        seen = set()
+        for index, group_id, permission_id, action in items:
+            if group_id not in groups:
+                self.add_error(index, "Group does not exist")
+            if permission_id not in permissions:
+                self.add_error(index, "Permission does not exist")
+            if index in self.errors:
+                continue
+            if (group_id, permission_id) in seen:
+                self.add_error(index, "Duplicate change")
+                continue
+            seen.add((group_id, permission_id))
+            assigned = (group_id, permission_id) in existing
+            if action == "add" and assigned:
+                self.add_error(index, "Permission already assigned")
+            elif action == "remove" and not assigned:
+                self.add_error(index, "Permission not assigned")
+            else:
+                self.changes.append((group_id, permission_id, action))
+
+    def get_existing(self, pairs):
+        """
+        Return a dict of (group id, permission id) to through table pk for the
+        given pairs that are assigned. Pairs are looked up in batches sorted by
+        permission, so each query only spans a few permissions
+        """
+        through = Group.permissions.through
+        pairs = sorted(pairs, key=lambda pair: (pair[1], pair[0]))
+        existing = {}
+        for start in range(0, len(pairs), self.delete_batch_size):
+            batch = pairs[start:start + self.delete_batch_size]
+            rows = through.objects.filter(
+                group_id__in={g for g, p in batch}, permission_id__in={p for g, p in batch}
+            ).values_list("pk", "group_id", "permission_id")
+            wanted = set(batch)
+            for pk, group_id, permission_id in rows:
+                if (group_id, permission_id) in wanted:
+                    existing[(group_id, permission_id)] = pk
+        return existing
+
+    def save(self):
+        """
+        Write the validated changes in one transaction, with batched bulk
+        inserts for additions and deletes by primary key for removals
+        """
+        through = Group.permissions.through
+        additions = [(g, p) for g, p, action in self.changes if action == "add"]
+        removal_ids = [self.existing[(g, p)] for g, p, action in self.changes if action == "remove"]
+        with transaction.atomic():
+            through.objects.bulk_create([through(group_id=g, permission_id=p) for g, p in additions],
+                                        batch_size=self.batch_size)
+            for start in range(0, len(removal_ids), self.delete_batch_size):
+                through.objects.filter(pk__in=removal_ids[start:start + self.delete_batch_size]).delete()
+            # Bulk writes bypass m2m_changed, so announce the changes directly.
+            # Caches are only invalidated once the transaction commits
+            permissions_changed.send(sender=self.__class__, changes=self.changes)
+        return self.changes
+
+
+# Cell values of a CSV spec meaning the permission is held, or is not
+TRUE_VALUES = {"1", "x", "y", "yes", "true"}
+FALSE_VALUES = {"", "0", "n", "no", "false"}
+SPEC_FORMATS = ("csv", "json", "yaml")
+
+
+class PermissionSpec(object):
+    """
+    Declared permissions of a set of groups. Applying a spec makes each
+    listed group hold exactly its declared permissions among the permissions
+    the spec manages, which are the columns of a CSV spec or every permission
+    for JSON and YAML specs. Groups that are not listed are left alone
+    """
+    batch_size = 1000
+    # Rows deleted per query, within the bound variable limits of all backends
+    delete_batch_size = 500
+
+    def __init__(self, grants, managed=None):
+        """
+        grants maps group names to sets of "app_label.codename" permission
+        names, and managed is the set of permission names the spec covers,
+        or None for all permissions
+        """
+        self.grants = grants
+        self.managed = managed
+        self.errors = []
+        self.new_groups = []
+        self.additions = []
+        self.removals = []
+        self.removal_ids = []
+        self.names = {}
+        self.group_names = {}
+
+    @classmethod
+    def load(cls, f, format):
+        """
+        Read a spec from a text file. CSV specs are laid out as exported, with
+        a group column followed by a column per permission name and 1 or 0
+        cells. JSON and YAML specs map group names to lists of permission names
+        """
+        if format == "csv":
+            return cls.from_rows(csv.reader(f))
+        if format == "yaml":
+            try:
+                import yaml
+            except ImportError:
+                raise ImproperlyConfigured("Reading YAML permission specs requires PyYAML to be installed")
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+        if not isinstance(data, dict) or not all(isinstance(names, list) for names in data.values()):
+            raise ValueError("Spec must map group names to lists of permission names")
+        return cls({str(group): {str(name) for name in names} for group, names in data.items()})
+
+    @classmethod
+    def from_rows(cls, rows):
+        rows = iter(rows)
+        header = next(rows, None)
+        if not header or header[0] != "group":
+            raise ValueError("First row must be a header starting with a group column")
+        names = header[1:]
+        grants = {}
+        for number, row in enumerate(rows, 2):
+            if not row:
+                continue
+            if len(row) != len(header):
+                raise ValueError("Row {} has {} cells, expected {}".format(number, len(row), len(header)))
+            held = set()
+            for name, value in zip(names, row[1:]):
+                value = value.strip().lower()
+                if value in TRUE_VALUES:
+                    held.add(name)
+                elif value not in FALSE_VALUES:
+                    raise ValueError("Row {} has {!r} for {}, expected 1 or 0".format(number, value, name))
+            grants[row[0]] = held
+        return cls(grants, set(names))
+
+    def diff(self, create_groups=False):
+        """
+        Compare the spec with the database, setting additions and removals
+        to lists of (group id, permission id) pairs. Reads permissions, groups
+        and the current grants of the listed groups in one query each, and
+        creates missing groups with one insert when create_groups is set
+        """
+        self.errors = []
+        self.names = {}
+        for pk, app_label, codename in Permission.objects.values_list("pk", "content_type__app_label", "codename"):
+            self.names["{}.{}".format(app_label, codename)] = pk
+        declared = set(self.managed or ())
+        for names in self.grants.values():
+            declared.update(names)
+        for name in sorted(declared - set(self.names)):
+            self.errors.append("Unknown permission {}".format(name))
+
+        groups = dict(Group.objects.filter(name__in=list(self.grants)).values_list("name", "pk"))
+        self.new_groups = sorted(set(self.grants) - set(groups))
+        if self.new_groups and not create_groups:
+            self.errors.extend("Unknown group {}".format(name) for name in self.new_groups)
+        if self.errors:
+            return False
+        if self.new_groups:
+            Group.objects.bulk_create([Group(name=name) for name in self.new_groups])
+            groups = dict(Group.objects.filter(name__in=list(self.grants)).values_list("name", "pk"))
+        self.group_names = {pk: name for name, pk in groups.items()}
+
+        desired = set()
+        for name, permission_names in self.grants.items():
+            desired.update((groups[name], self.names[p]) for p in permission_names)
+        managed = None if self.managed is None else {self.names[name] for name in self.managed}
+        current = {}
+        rows = Group.permissions.through.objects.filter(group_id__in=list(groups.values()))
+        for pk, group_id, permission_id in rows.values_list("pk", "group_id", "permission_id").iterator():
+            if managed is None or permission_id in managed:
+                current[(group_id, permission_id)] = pk
+        self.additions = sorted(desired.difference(current))
+        self.removals = sorted(set(current).difference(desired))
+        self.removal_ids = [current[key] for key in self.removals]
+        return True
+
+    @property
+    def changes(self):
+        return ([(g, p, "add") for g, p in self.additions] +
+                [(g, p, "remove") for g, p in self.removals])
+
+    def apply(self, create_groups=False, dry_run=False):
+        """
+        Diff and write the spec in one transaction, with batched bulk inserts
+        and deletes on the group permissions table. A dry run works out the
+        diff, including any groups to create, then rolls back. Returns False
+        if the spec has errors
+        """
+        through = Group.permissions.through
+        with transaction.atomic():
+            if not self.diff(create_groups):
+                return False
+            if dry_run:
+                transaction.set_rollback(True)
+                return True
+            through.objects.bulk_create([through(group_id=g, permission_id=p) for g, p in self.additions],
+                                        batch_size=self.batch_size)
+            for start in range(0, len(self.removal_ids), self.delete_batch_size):
+                through.objects.filter(pk__in=self.removal_ids[start:start + self.delete_batch_size]).delete()
+            if self.new_groups:
+                groups_changed([pk for pk, name in self.group_names.items() if name in self.new_groups])
+            if self.additions or self.removals:
+                # Bulk writes bypass m2m_changed, so announce the changes directly
+                permissions_changed.send(sender=self.__class__, changes=self.changes)
+        return True
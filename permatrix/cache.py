@@ -0,0 +1,267 @@
+from django.core.cache import cache
+from django.db import transaction
+
+import time
+
+KEY_PREFIX = "permatrix"
+
+# Names of the version counters kept in the cache
+HEADERS = "headers"
+ROWS = "rows"
+MATRIX = "matrix"
+USERS = "users"
+SNAPSHOT = "snapshot"
+
+# Seconds to keep indexes and snapshots, which are cached under a new key for
+# every matrix version, so keys left behind by later versions expire
+SNAPSHOT_TIMEOUT = 60 * 60
+
+
+def make_key(*parts):
+    return ":".join([KEY_PREFIX] + [str(part) for part in parts])
+
+
+def _initial_version():
+    # Start counters from the current time rather than 1, so that a counter
+    # evicted from the cache can never come back at a value already used
+    return int(time.time() * 1000)
+
+
+def get_version(name):
+    """
+    Return the current value of a named version counter, initialising it if it
+    is not in the cache yet
+    """
+    key = make_key("version", name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    """
+    Increment a named version counter, making anything cached under the
+    previous version unreachable
+    """
+    key = make_key("version", name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), None)
+        return cache.get(key)
+
+
+def get_columns(builder, database=None, timeout=None):
+    """
+    Return the cached column index for the current headers version, calling
+    builder to create and cache it on a miss. Indexes read from a database
+    other than the default are cached separately, for timeout seconds
+    """
+    key = make_key(HEADERS, get_version(HEADERS))
+    if database is not None:
+        key = "{}@{}".format(key, database)
+    columns = cache.get(key)
+    if columns is None:
+        columns = builder()
+        cache.set(key, columns, timeout)
+    return columns
+
+
+# Objects most recently pulled from the cache by this process, as name to
+# (key, object)
+_local = {}
+
+
+def _get_local(name, key, builder, timeout=None):
+    """
+    Return the object cached under key, kept in process memory while key stays
+    current, falling back to the shared cache and then to calling builder
+    """
+    local = _local.get(name)
+    if local is not None and local[0] == key:
+        return local[1]
+    value = cache.get(key)
+    if value is None:
+        value = builder()
+        cache.add(key, value, timeout)
+    _local[name] = (key, value)
+    return value
+
+
+def get_index(builder):
+    """
+    Return the permission index for the current headers and matrix versions.
+    The index is kept in process memory between requests, falling back to
+    the shared cache and then to calling builder when the versions move on
+    """
+    key = make_key("index", get_version(HEADERS), get_version(MATRIX))
+    return _get_local("index", key, builder, SNAPSHOT_TIMEOUT)
+
+
+def _snapshot_key(matrix_version, database=None):
+    key = make_key(SNAPSHOT, get_version(HEADERS), matrix_version)
+    if database is not None:
+        key = "{}@{}".format(key, database)
+    return key
+
+
+def get_snapshot(builder, database=None, timeout=None):
+    """
+    Return the membership snapshot for the current headers and matrix
+    versions, pulled from the shared cache into process memory when the
+    versions move on, or built by calling builder if no process has cached
+    it yet. Snapshots read from a database other than the default are cached
+    separately, for timeout seconds
+    """
+    if timeout is None:
+        timeout = SNAPSHOT_TIMEOUT
+    key = _snapshot_key(get_version(MATRIX), database)
+    return _get_local("{}@{}".format(SNAPSHOT, database), key, builder, timeout)
+
+
+def update_snapshot(version, changes):
+    """
+    Store the snapshot for a new matrix version by applying changes to the
+    snapshot of the version before it, and drop the previous snapshot. This
+    runs once the changes are committed, so any snapshot a reader builds for
+    the new version already holds them, and applying them again to a previous
+    snapshot that was read after the commit leaves it unchanged. Callers only
+    patch when no other version was taken since the changes were made, as
+    the previous snapshot may otherwise lack changes committed before them.
+    If the previous snapshot is missing, the new version is simply built by
+    the next reader
+    """
+    previous_key = _snapshot_key(version - 1)
+    previous = cache.get(previous_key)
+    if previous is not None:
+        cache.add(_snapshot_key(version), previous.apply(changes), SNAPSHOT_TIMEOUT)
+        cache.delete(previous_key)
+
+
+def _incr(key, delta=1):
+    if not delta:
+        return
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, None):
+            cache.incr(key, delta)
+
+
+def _generation_key(group_id):
+    return make_key(ROWS, "generation", group_id)
+
+
+def row_keys(group_ids, variant="", fingerprints=None):
+    """
+    Return the row cache keys for a list of group ids. Keys include a per
+    group generation, so invalidating a group reaches every variant of its row,
+    and with fingerprints, a digest of the data each row is rendered from
+    """
+    generation_keys = [_generation_key(group_id) for group_id in group_ids]
+    generations = cache.get_many(generation_keys)
+    missing = {key: _initial_version() for key in generation_keys if key not in generations}
+    if missing:
+        cache.set_many(missing, None)
+        generations.update(missing)
+    prefix = make_key(ROWS, get_version(ROWS), get_version(HEADERS), variant)
+    keys = ["{}:{}:{}".format(prefix, group_id, generations[key])
+            for group_id, key in zip(group_ids, generation_keys)]
+    if fingerprints is not None:
+        keys = ["{}:{}".format(key, fingerprint) for key, fingerprint in zip(keys, fingerprints)]
+    return keys
+
+
+def cache_rows(rows, variant="", timeout=None):
+    """
+    Fill in the HTML of each row from the cache in a single lookup, rendering
+    and caching the rows that are missing for timeout seconds, or forever if
+    None. variant identifies the set of columns the rows were rendered with.
+
+    Rows are keyed by the fingerprint of the memberships they were read with
+    as well as the group's generation. A change committed after the
+    memberships were read moves the generation on, and rows rendered from
+    the old memberships are then stored under a key for the old data, where
+    no request for the new data can find them
+    """
+    keys = row_keys([row.group.pk for row in rows], variant, [row.fingerprint for row in rows])
+    cached = cache.get_many(keys)
+    rendered = {}
+    for key, row in zip(keys, rows):
+        if key in cached:
+            row.cached_html = cached[key]
+        else:
+            row.cached_html = rendered[key] = row.render()
+    if rendered:
+        cache.set_many(rendered, timeout)
+    _incr(make_key("stats", ROWS, "hits"), len(cached))
+    _incr(make_key("stats", ROWS, "misses"), len(rendered))
+
+
+def invalidate_row(group_id):
+    key = _generation_key(group_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_version(), None)
+
+
+def invalidate_rows():
+    bump_version(ROWS)
+
+
+def groups_changed(group_ids=None, changes=None, using=None):
+    """
+    Record that the permissions of some groups changed, invalidating their
+    cached rows and bumping the matrix version. group_ids of None means any
+    group may have changed. When the changes are given as a list of (group
+    id, permission id, action), the membership snapshot is updated with them,
+    unless another change took a matrix version first, in which case the next
+    reader rebuilds it.
+
+    Nothing is invalidated until the current transaction on the database
+    alias using commits, so a request reading the old data in the meantime
+    cannot cache it under the new versions, and nothing is invalidated at all
+    if the transaction rolls back
+    """
+    if group_ids is not None:
+        group_ids = list(group_ids)
+    seen = None
+    if changes is not None:
+        changes = list(changes)
+        seen = get_version(MATRIX)
+    transaction.on_commit(lambda: _groups_changed(group_ids, changes, seen), using=using)
+
+
+def _groups_changed(group_ids, changes, seen=None):
+    if group_ids is None:
+        invalidate_rows()
+    else:
+        for group_id in group_ids:
+            invalidate_row(group_id)
+    version = bump_version(MATRIX)
+    # Callbacks of concurrent transactions run in no particular order, so the
+    # snapshot is only patched when this change took the version right after
+    # the one current when it was made
+    if changes and seen is not None and version == seen + 1:
+        update_snapshot(version, changes)
+
+
+def users_changed():
+    """
+    Record that user permissions, group memberships or flags changed
+    """
+    bump_version(USERS)
+
+
+def row_cache_stats():
+    """
+    Return the row cache hit and miss counts shared by all processes using
+    the cache
+    """
+    return {
+        "hits": cache.get(make_key("stats", ROWS, "hits"), 0),
+        "misses": cache.get(make_key("stats", ROWS, "misses"), 0),
+    }
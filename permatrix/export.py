@@ -0,0 +1,71 @@
+from django.core.exceptions import ImproperlyConfigured
+
+import csv
+
+from permatrix.matrix import PermissionMatrix
+
+FORMATS = ("csv", "xlsx")
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+class Echo(object):
+    """
+    File-like object returning what is written to it, so a csv writer can
+    produce lines for streaming
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_rows(view):
+    """
+    Yield a header row of "app_label.codename" permission names, in the column
+    order of the view, then a row per group of its name and a 1 or 0 for each
+    permission. Groups and memberships are read from server side cursors and
+    only one row is held at a time, so memory does not grow with the groups
+    """
+    columns = view.get_columns()
+    yield ["group"] + [node["name"] for node in columns.permissions]
+    matrix = PermissionMatrix(columns.pks, columns.positions)
+    for group, permission_ids in view.iter_memberships():
+        matrix.add_row(group.pk, permission_ids)
+        yield [group.name] + [1 if flag else 0 for flag in matrix.row(group.pk)]
+        del matrix.rows[group.pk]
+
+
+def iter_csv(view):
+    """
+    Yield the export as lines of CSV
+    """
+    writer = csv.writer(Echo())
+    for row in iter_rows(view):
+        yield writer.writerow(row)
+
+
+def write_csv(view, output):
+    writer = csv.writer(output)
+    for row in iter_rows(view):
+        writer.writerow(row)
+
+
+def write_xlsx(view, output):
+    """
+    Write the export as a workbook to a filename or binary file object, with
+    XlsxWriter in constant memory mode so each row is flushed to disk as soon
+    as it is written. Strings are never converted to formulas, so a group named
+    like "=HYPERLINK(...)" is written as its name
+    """
+    try:
+        import xlsxwriter
+    except ImportError:
+        raise ImproperlyConfigured("Exporting the permission matrix as XLSX requires XlsxWriter to be installed")
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True, "strings_to_formulas": False})
+    worksheet = workbook.add_worksheet("Permissions")
+    worksheet.freeze_panes(1, 1)
+    for number, row in enumerate(iter_rows(view)):
+        worksheet.write_row(number, 0, row)
+    workbook.close()
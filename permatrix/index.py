@@ -0,0 +1,139 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+
+from permatrix import cache
+
+ANY = "any"
+ALL = "all"
+
+
+class PermissionIndex(object):
+    """
+    Inverted index of the group permission table, mapping each permission id
+    to the set of ids of the groups that hold it, with maps of
+    "app_label.codename" names to permission ids and of group ids to names
+    """
+
+    def __init__(self, permissions, groups, memberships):
+        """
+        permissions is an iterable of (id, app label, codename), groups of
+        (id, name) and memberships of (group id, permission id) pairs
+        """
+        self.group_names = dict(groups)
+        self.permission_ids = {}
+        self.names = {}
+        for pk, app_label, codename in permissions:
+            name = "{}.{}".format(app_label, codename)
+            self.permission_ids[name] = pk
+            self.names[pk] = name
+        holders = {}
+        for group_id, permission_id in memberships:
+            holders.setdefault(permission_id, set()).add(group_id)
+        self.groups = {pk: frozenset(group_ids) for pk, group_ids in holders.items()}
+
+    def resolve(self, names):
+        """
+        Return the ids of a list of permission names, and the names that are
+        not known
+        """
+        ids = []
+        unknown = []
+        for name in names:
+            if name in self.permission_ids:
+                ids.append(self.permission_ids[name])
+            else:
+                unknown.append(name)
+        return ids, unknown
+
+    def group_ids(self, permission_ids, match=ANY):
+        """
+        Return the ids of the groups holding any or all of the given permissions
+        """
+        sets = [self.groups.get(pk, frozenset()) for pk in permission_ids]
+        if not sets:
+            return frozenset()
+        if match == ALL:
+            # Intersect smallest first, so the working set only shrinks
+            sets.sort(key=len)
+            return sets[0].intersection(*sets[1:])
+        return frozenset().union(*sets)
+
+    def named_groups(self, group_ids):
+        """
+        Return a list of {"id", "name"} dicts for some groups, ordered by name
+        """
+        return sorted(({"id": pk, "name": self.group_names[pk]} for pk in group_ids),
+                      key=lambda group: (group["name"], group["id"]))
+
+
+def build_index():
+    permissions = Permission.objects.values_list("pk", "content_type__app_label", "codename")
+    groups = Group.objects.values_list("pk", "name")
+    memberships = Group.permissions.through.objects.values_list("group_id", "permission_id")
+    return PermissionIndex(permissions.iterator(), groups.iterator(), memberships.iterator())
+
+
+def get_index():
+    """
+    Return the index for the current permission table and group permissions
+    """
+    return cache.get_index(build_index)
+
+
+def user_ids(index, permission_ids, match=ANY):
+    """
+    Return the ids of the users holding any or all of the given permissions,
+    through their groups, directly, or as active superusers, in four queries.
+    Inactive users hold no permissions
+    """
+    User = get_user_model()
+    fields = {field.name for field in User._meta.get_fields()}
+    holders = {pk: set() for pk in permission_ids}
+    if "groups" in fields:
+        group_ids = index.group_ids(permission_ids)
+        field = User._meta.get_field("groups")
+        source, target = field.m2m_field_name(), field.m2m_reverse_field_name()
+        rows = field.remote_field.through.objects.filter(**{target + "__in": group_ids})
+        for user_id, group_id in rows.values_list(source, target).iterator():
+            for pk in permission_ids:
+                if group_id in index.groups.get(pk, ()):
+                    holders[pk].add(user_id)
+    if "user_permissions" in fields:
+        field = User._meta.get_field("user_permissions")
+        source, target = field.m2m_field_name(), field.m2m_reverse_field_name()
+        rows = field.remote_field.through.objects.filter(**{target + "__in": permission_ids})
+        for user_id, permission_id in rows.values_list(source, target).iterator():
+            holders[permission_id].add(user_id)
+    sets = list(holders.values())
+    if not sets:
+        return set()
+    found = set.intersection(*sets) if match == ALL else set.union(*sets)
+    users = User.objects.all()
+    if "is_superuser" in fields:
+        superusers = users.filter(is_superuser=True)
+        if "is_active" in fields:
+            superusers = superusers.filter(is_active=True)
+        found.update(superusers.values_list("pk", flat=True))
+    if "is_active" in fields and found:
+        found = set(users.filter(pk__in=found, is_active=True).values_list("pk", flat=True))
+    return found
+
+
+def holders(names, match=ANY, users=False):
+    """
+    Answer who holds any (match="any") or all (match="all") of the named
+    permissions, given as "app_label.codename". Returns a dict with a list of
+    {"id", "name"} for the matching groups, answered from the index without
+    querying the database, and if users is true a list of {"id", "username"}
+    for the matching users. Unknown names raise KeyError
+    """
+    index = get_index()
+    permission_ids, unknown = index.resolve(names)
+    if unknown:
+        raise KeyError(unknown[0])
+    result = {"groups": index.named_groups(index.group_ids(permission_ids, match))}
+    if users:
+        User = get_user_model()
+        found = User.objects.filter(pk__in=user_ids(index, permission_ids, match)).order_by(User.USERNAME_FIELD, "pk")
+        result["users"] = [{"id": user.pk, "username": user.get_username()} for user in found]
+    return result
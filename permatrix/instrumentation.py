@@ -0,0 +1,62 @@
+from django.db import connections
+from django.dispatch import Signal
+
+from contextlib import contextmanager, ExitStack
+import timeit
+
+# Sent after each instrumented phase of a view, with phase, duration (in
+# seconds) and queries keyword arguments
+phase_finished = Signal()
+
+
+class QueryCounter(object):
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class PhaseTimer(object):
+    """
+    Record the duration and number of database queries of named phases of a
+    request, publishing each through the phase_finished signal
+    """
+
+    def __init__(self, sender):
+        self.sender = sender
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        counter = QueryCounter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(counter))
+            start = timeit.default_timer()
+            yield
+            duration = timeit.default_timer() - start
+        self.phases.append((name, duration, counter.count))
+        phase_finished.send(sender=self.sender, phase=name, duration=duration, queries=counter.count)
+
+    def server_timing(self):
+        """
+        Format the recorded phases as a Server-Timing header value
+        """
+        return ", ".join(
+            '{};dur={:.2f};desc="{} queries"'.format(name, duration * 1000, queries)
+            for name, duration, queries in self.phases
+        )
+
+
+class NullTimer(object):
+    """
+    Stand in for PhaseTimer when instrumentation is switched off
+    """
+    phases = ()
+
+    @contextmanager
+    def phase(self, name):
+        yield
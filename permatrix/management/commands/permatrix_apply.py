@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+import io
+import os
+
+from permatrix.bulk import PermissionSpec, SPEC_FORMATS
+
+
+class Command(BaseCommand):
+    help = ("Make groups hold exactly the permissions declared in a CSV, JSON or YAML spec, "
+            "writing only the differences")
+
+    def add_arguments(self, parser):
+        parser.add_argument("spec", help="Spec file to apply")
+        parser.add_argument("-f", "--format", choices=SPEC_FORMATS,
+                            help="Spec format, by default taken from the file extension")
+        parser.add_argument("--dry-run", action="store_true", help="Print the changes without making them")
+        parser.add_argument("--create-groups", action="store_true", help="Create groups that do not exist")
+
+    def handle(self, *args, **options):
+        path = options["spec"]
+        format = options["format"]
+        if format is None:
+            extension = os.path.splitext(path)[1].lstrip(".").lower()
+            format = "yaml" if extension == "yml" else extension
+            if format not in SPEC_FORMATS:
+                raise CommandError("Can not tell the format of {}, use --format".format(path))
+        try:
+            with io.open(path, newline="", encoding="utf-8") as f:
+                spec = PermissionSpec.load(f, format)
+        except (IOError, ValueError) as e:
+            raise CommandError("Could not read {}: {}".format(path, e))
+
+        if not spec.apply(options["create_groups"], options["dry_run"]):
+            raise CommandError("\n".join(spec.errors))
+
+        verbose = options["dry_run"] or options["verbosity"] > 1
+        if verbose:
+            permission_names = {pk: name for name, pk in spec.names.items()}
+            for name in spec.new_groups:
+                self.stdout.write("create group {}".format(name))
+            for prefix, pairs in (("+", spec.additions), ("-", spec.removals)):
+                for group_id, permission_id in pairs:
+                    self.stdout.write("{} {} {}".format(
+                        prefix, spec.group_names[group_id], permission_names[permission_id]))
+        self.stdout.write("{}{} additions, {} removals, {} new groups".format(
+            "Dry run: " if options["dry_run"] else "", len(spec.additions), len(spec.removals),
+            len(spec.new_groups)))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+import io
+
+from permatrix import export
+from permatrix.views import PermissionMatrixView
+
+
+class Command(BaseCommand):
+    help = "Export the group permission matrix as CSV or XLSX, one row per group"
+
+    def add_arguments(self, parser):
+        parser.add_argument("-o", "--output", help="File to write to, standard output if not given (CSV only)")
+        parser.add_argument("-f", "--format", choices=export.FORMATS,
+                            help="Export format, by default taken from the output file extension or CSV")
+        parser.add_argument("--apps", help="Comma separated app labels to export permissions of")
+        parser.add_argument("--group", default="", help="Only export groups whose names start with this")
+
+    def handle(self, *args, **options):
+        output = options["output"]
+        format = options["format"]
+        if format is None:
+            format = "xlsx" if output and output.endswith(".xlsx") else "csv"
+        if format == "xlsx" and not output:
+            raise CommandError("An output file is required for XLSX exports")
+
+        view = PermissionMatrixView(instrument=False)
+        view.limit = None
+        view.group_prefix = options["group"]
+        if options["apps"]:
+            view.app_labels = sorted({label.strip() for label in options["apps"].split(",") if label.strip()})
+
+        if format == "xlsx":
+            export.write_xlsx(view, output)
+        elif output:
+            with io.open(output, "w", newline="", encoding="utf-8") as f:
+                export.write_csv(view, f)
+        else:
+            export.write_csv(view, self.stdout)
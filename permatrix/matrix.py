@@ -0,0 +1,226 @@
+from collections import OrderedDict
+from itertools import chain, islice
+
+# Flags for each bit of every possible byte, least significant bit first
+BYTE_FLAGS = [tuple(bool(byte & (1 << bit)) for bit in range(8)) for byte in range(256)]
+
+
+class ColumnIndex(object):
+    """
+    Immutable, ordered index of the module, model and permission header nodes
+    of the matrix, with a map of permission id to column position
+    """
+
+    def __init__(self, modules, models, permissions):
+        permissions = tuple(permissions)
+        pks = tuple(node["permission"].pk for node in permissions)
+        object.__setattr__(self, "modules", tuple(modules))
+        object.__setattr__(self, "models", tuple(models))
+        object.__setattr__(self, "permissions", permissions)
+        object.__setattr__(self, "pks", pks)
+        object.__setattr__(self, "positions", {pk: i for i, pk in enumerate(pks)})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ColumnIndex is immutable")
+
+    def __len__(self):
+        return len(self.permissions)
+
+    def position(self, permission_id):
+        return self.positions.get(permission_id)
+
+    def restrict(self, app_labels):
+        """
+        Return a new index containing only the columns of the given apps
+        """
+        app_labels = set(app_labels)
+        return ColumnIndex(
+            [node for node in self.modules if node["ct"].app_label in app_labels],
+            [node for node in self.models if node["ct"].app_label in app_labels],
+            [node for node in self.permissions if node["permission"].content_type.app_label in app_labels],
+        )
+
+
+class PermissionMatrix(object):
+    """
+    Group by permission grant matrix, stored as one bitset per group over an
+    ordered list of permission id columns
+    """
+
+    def __init__(self, columns, positions=None):
+        self.columns = list(columns)
+        if positions is None:
+            positions = {pk: i for i, pk in enumerate(self.columns)}
+        self.positions = positions
+        self.rows = OrderedDict()
+
+    @property
+    def width(self):
+        return len(self.columns)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __contains__(self, group_id):
+        return group_id in self.rows
+
+    def add_row(self, group_id, permission_ids=()):
+        """
+        Add a row for a group, setting the bits for the given permission ids.
+        Permissions that are not columns of the matrix are ignored
+        """
+        bits = bytearray((self.width + 7) // 8)
+        for pk in permission_ids:
+            position = self.positions.get(pk)
+            if position is not None:
+                bits[position >> 3] |= 1 << (position & 7)
+        self.rows[group_id] = bits
+        return bits
+
+    def add_full_row(self, row_id):
+        """
+        Add a row with every column set
+        """
+        bits = bytearray(b"\xff" * ((self.width + 7) // 8))
+        if self.width & 7:
+            bits[-1] = (1 << (self.width & 7)) - 1
+        self.rows[row_id] = bits
+        return bits
+
+    def add_union_row(self, row_id, sources, permission_ids=()):
+        """
+        Add a row holding the union of some existing bitsets of the same width
+        and the given permission ids. The bitsets are combined as integers, so
+        each union is one operation per source rather than one per column
+        """
+        bits = self.add_row(row_id, permission_ids)
+        if sources:
+            value = int.from_bytes(bits, "little")
+            for source in sources:
+                value |= int.from_bytes(source, "little")
+            bits[:] = value.to_bytes(len(bits), "little")
+        return bits
+
+    def add_bitmap_row(self, row_id, bitmap, runs=None):
+        """
+        Add a row copied from a bitmap over other columns. runs is a list of
+        (source position, target position, length) runs of columns to copy,
+        as given by column_runs, or None when the bitmap has the same columns
+        """
+        if runs is None:
+            bits = bytearray(bitmap)
+        else:
+            value = int.from_bytes(bitmap, "little")
+            result = 0
+            for source, target, length in runs:
+                result |= ((value >> source) & ((1 << length) - 1)) << target
+            bits = bytearray(result.to_bytes((self.width + 7) // 8, "little"))
+        self.rows[row_id] = bits
+        return bits
+
+    def column_runs(self, source_columns):
+        """
+        Find the runs of this matrix's columns that are consecutive in a list
+        of source columns, for add_bitmap_row. Columns missing from the source
+        are left unset
+        """
+        source_positions = {pk: i for i, pk in enumerate(source_columns)}
+        runs = []
+        for target, pk in enumerate(self.columns):
+            source = source_positions.get(pk)
+            if source is None:
+                continue
+            if runs and runs[-1][0] + runs[-1][2] == source and runs[-1][1] + runs[-1][2] == target:
+                runs[-1][2] += 1
+            else:
+                runs.append([source, target, 1])
+        return runs
+
+    def has_perm(self, group_id, permission_id):
+        position = self.positions.get(permission_id)
+        if position is None or group_id not in self.rows:
+            return False
+        return bool(self.rows[group_id][position >> 3] & (1 << (position & 7)))
+
+    def grant(self, group_id, permission_id):
+        position = self.positions[permission_id]
+        self.rows[group_id][position >> 3] |= 1 << (position & 7)
+
+    def revoke(self, group_id, permission_id):
+        position = self.positions[permission_id]
+        self.rows[group_id][position >> 3] &= ~(1 << (position & 7)) & 0xff
+
+    def row(self, group_id):
+        """
+        Iterate over a group's row, giving a boolean for each column in order
+        """
+        bits = self.rows[group_id]
+        return islice(chain.from_iterable(BYTE_FLAGS[byte] for byte in bits), self.width)
+
+    def permission_ids(self, group_id):
+        """
+        Iterate over the permission ids granted to a group, in column order
+        """
+        for pk, has_perm in zip(self.columns, self.row(group_id)):
+            if has_perm:
+                yield pk
+
+
+class MembershipSnapshot(object):
+    """
+    Compact copy of the group permission matrix for sharing between processes
+    through the cache: the groups in name order as (id, name) pairs, and each
+    group's grants as a bitmap over a tuple of permission id columns
+    """
+
+    def __init__(self, columns, groups, rows):
+        self.columns = tuple(columns)
+        self.groups = list(groups)
+        self.rows = rows
+
+    @classmethod
+    def build(cls, columns, groups, memberships):
+        """
+        Build a snapshot from the column ids, (id, name) pairs of the groups in
+        order, and a dict of group id to permission ids
+        """
+        matrix = PermissionMatrix(columns)
+        rows = {}
+        for group_id, name in groups:
+            rows[group_id] = bytes(matrix.add_row(group_id, memberships.get(group_id, ())))
+        return cls(columns, groups, rows)
+
+    def apply(self, changes):
+        """
+        Return a new snapshot with a list of (group id, permission id, action)
+        changes applied. Groups that are not in the snapshot are ignored
+        """
+        matrix = PermissionMatrix(self.columns)
+        rows = dict(self.rows)
+        for group_id, permission_id, action in changes:
+            if group_id not in rows or permission_id not in matrix.positions:
+                continue
+            if group_id not in matrix:
+                matrix.rows[group_id] = bytearray(rows[group_id])
+            if action == "add":
+                matrix.grant(group_id, permission_id)
+            else:
+                matrix.revoke(group_id, permission_id)
+        for group_id, bits in matrix.rows.items():
+            rows[group_id] = bytes(bits)
+        return MembershipSnapshot(self.columns, self.groups, rows)
+
+    def window(self, prefix="", offset=0, limit=None):
+        """
+        Return the (id, name) pairs of a window of the groups whose names start
+        with prefix, as the matrix view pages them
+        """
+        groups = self.groups
+        if prefix:
+            groups = [group for group in groups if group[1].startswith(prefix)]
+        if limit is not None:
+            return groups[offset:offset + limit]
+        return groups[offset:]
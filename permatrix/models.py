@@ -1 +1,53 @@
 # -*- coding: utf-8 -*-
+from django.db import models
+
+# Largest batch of changes journaled individually, bigger batches are
+# recorded as a single reset entry
+JOURNAL_MAX_BATCH = 1000
+
+
+class PermissionChangeManager(models.Manager):
+
+    def record(self, changes):
+        """
+        Journal a list of (group id, permission id, action) changes
+        """
+        if not changes:
+            return
+        if len(changes) > JOURNAL_MAX_BATCH:
+            self.create(action=self.model.RESET)
+            return
+        self.bulk_create([
+            self.model(group_id=group_id, permission_id=permission_id, action=action)
+            for group_id, permission_id, action in changes
+        ])
+
+    def latest_seq(self):
+        return self.order_by("-pk").values_list("pk", flat=True).first() or 0
+
+
+class PermissionChange(models.Model):
+    """
+    Journal of group permission changes. The primary key is the sequence
+    number clients use to ask for changes since the state they last saw.
+    Group and permission are stored as plain ids so that entries outlive
+    the rows they refer to
+    """
+    ADD = "add"
+    REMOVE = "remove"
+    # Too many changes to list, clients should reload the whole matrix
+    RESET = "reset"
+    ACTIONS = ((ADD, "add"), (REMOVE, "remove"), (RESET, "reset"))
+
+    group_id = models.IntegerField(null=True)
+    permission_id = models.IntegerField(null=True)
+    action = models.CharField(max_length=6, choices=ACTIONS)
+    created = models.DateTimeField(auto_now_add=True)
+
+    objects = PermissionChangeManager()
+
+    class Meta:
+        ordering = ("id",)
+
+    def as_list(self):
+        return [self.group_id, self.permission_id, self.action]
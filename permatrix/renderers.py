@@ -0,0 +1,145 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.template.loader import get_template
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+
+import os
+
+# Short names for the built in row renderers, for the PERMATRIX_RENDERER setting
+RENDERERS = {
+    "python": "permatrix.renderers.RowRenderer",
+    "django": "permatrix.renderers.DjangoTemplateRowRenderer",
+    "jinja2": "permatrix.renderers.Jinja2RowRenderer",
+    "slim": "permatrix.renderers.SlimRowRenderer",
+}
+
+
+def get_renderer_class(name):
+    """
+    Look up a row renderer class by short name or dotted path
+    """
+    try:
+        return import_string(RENDERERS.get(name, name))
+    except ImportError as e:
+        raise ImproperlyConfigured("Could not load permatrix row renderer {!r}: {}".format(name, e))
+
+
+class RowRenderer(object):
+    """
+    Render group rows of permission cells. Everything that only depends on the
+    column is rendered once up front, leaving one join per row
+    """
+    name = "python"
+    # Slim rows leave permission data to the header cells of each column
+    slim = False
+    cell_class = "permission-cell"
+    # Attributes identifying the row on each cell, given its pk and label
+    row_attrs = "data-group_id='{}' data-group_name='{}' "
+
+    def __init__(self, permissions):
+        self.granted = []
+        self.not_granted = []
+        for permission in permissions:
+            attrs = "data-permission_id='{}' data-permission_name='{}' data-module='{}' class='{}".format(
+                permission["permission"].pk, escape(permission["name"]),
+                escape(permission["permission"].content_type.app_label), self.cell_class
+            )
+            self.granted.append(attrs + " perm_yes'></td>")
+            self.not_granted.append(attrs + "'></td>")
+
+    def render(self, group, flags):
+        """
+        Render the row for a group, given a flag for each column in order
+        """
+        return "<tr><td>{}</td>{}</tr>".format(escape(self.label(group)), self.render_cells(group, flags))
+
+    def render_cells(self, group, flags):
+        """
+        Render only the permission cells of a group's row
+        """
+        cell_start = "<td " + self.row_attrs.format(group.pk, escape(self.label(group)))
+        cells = [g if flag else n for g, n, flag in zip(self.granted, self.not_granted, flags)]
+        if cells:
+            cells[0] = cell_start + cells[0]
+        return cell_start.join(cells)
+
+    def label(self, group):
+        return group.name
+
+
+class SlimRowRenderer(RowRenderer):
+    """
+    Render compact rows, with the group's data on the row and bare cells
+    carrying only the perm_yes class when granted. The permission of a cell
+    is found from the header cell in the same column
+    """
+    name = "slim"
+    slim = True
+
+    def __init__(self, permissions):
+        pass
+
+    def render(self, group, flags):
+        name = escape(self.label(group))
+        return "<tr {}><td>{}</td>{}</tr>".format(
+            self.row_attrs.format(group.pk, name).strip(), name, self.render_cells(group, flags))
+
+    def render_cells(self, group, flags):
+        return "".join(["<td class='perm_yes'></td>" if flag else "<td></td>" for flag in flags])
+
+
+class UserRowRenderer(RowRenderer):
+    """
+    Render read only rows of a user's effective permissions. Cells do not
+    have the permission-cell class, so they can not be clicked to edit
+    """
+    cell_class = "user-permission-cell"
+    row_attrs = "data-user_id='{}' data-username='{}' "
+
+    def label(self, user):
+        return user.get_username()
+
+
+class DjangoTemplateRowRenderer(object):
+    """
+    Render group rows with the permatrix/row.html Django template
+    """
+    name = "django"
+    slim = False
+    template_name = "permatrix/row.html"
+
+    def __init__(self, permissions):
+        self.permissions = permissions
+        self.template = get_template(self.template_name)
+
+    def render(self, group, flags):
+        return self.template.render({"group": group, "cells": zip(self.permissions, flags)}).strip()
+
+
+class Jinja2RowRenderer(object):
+    """
+    Render group rows with the permatrix/row.html Jinja2 template. Needs the
+    optional Jinja2 dependency
+    """
+    name = "jinja2"
+    slim = False
+    template_name = "permatrix/row.html"
+    environment = None
+
+    def __init__(self, permissions):
+        self.permissions = permissions
+        self.template = self.get_environment().get_template(self.template_name)
+
+    @classmethod
+    def get_environment(cls):
+        if cls.environment is None:
+            try:
+                import jinja2
+            except ImportError:
+                raise ImproperlyConfigured("The jinja2 permatrix renderer requires Jinja2 to be installed")
+            directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jinja2")
+            cls.environment = jinja2.Environment(loader=jinja2.FileSystemLoader(directory), autoescape=True)
+        return cls.environment
+
+    def render(self, group, flags):
+        return self.template.render(group=group, cells=zip(self.permissions, flags)).strip()
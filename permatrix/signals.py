@@ -0,0 +1,83 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.dispatch import receiver, Signal
+
+try:
+    from django.db.models.signals import post_migrate
+except ImportError:
+    from django.db.models.signals import post_syncdb as post_migrate
+
+from permatrix.cache import bump_version, groups_changed, users_changed, HEADERS, MATRIX
+from permatrix.models import PermissionChange
+
+# Sent when group permissions are changed by a path that bypasses
+# m2m_changed, with changes as a list of (group id, permission id, action)
+permissions_changed = Signal()
+
+
+@receiver(post_migrate)
+def migrated(sender, **kwargs):
+    bump_version(HEADERS)
+    bump_version(MATRIX)
+
+
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+@receiver(post_save, sender=ContentType)
+@receiver(post_delete, sender=ContentType)
+def headers_changed(sender, **kwargs):
+    bump_version(HEADERS)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, using=None, **kwargs):
+    groups_changed([instance.pk], using=using)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, instance, action, reverse, pk_set, using=None, **kwargs):
+    if action == "pre_clear":
+        # Remember what is about to be cleared so it can be journaled
+        if reverse:
+            instance._permatrix_cleared = list(sender.objects.filter(permission_id=instance.pk).values_list(
+                "group_id", flat=True))
+        else:
+            instance._permatrix_cleared = list(sender.objects.filter(group_id=instance.pk).values_list(
+                "permission_id", flat=True))
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if action == "post_clear":
+        pk_set = getattr(instance, "_permatrix_cleared", None)
+    change = "add" if action == "post_add" else "remove"
+    if reverse:
+        changes = [(group_id, instance.pk, change) for group_id in pk_set or ()]
+        PermissionChange.objects.record(changes)
+        groups_changed(pk_set, changes, using=using)
+    else:
+        changes = [(instance.pk, permission_id, change) for permission_id in pk_set or ()]
+        PermissionChange.objects.record(changes)
+        groups_changed([instance.pk], changes, using=using)
+
+
+@receiver(permissions_changed)
+def changes_applied(sender, changes, **kwargs):
+    PermissionChange.objects.record(changes)
+    groups_changed({change[0] for change in changes}, changes)
+
+
+def user_changed(sender, **kwargs):
+    users_changed()
+
+
+User = get_user_model()
+post_save.connect(user_changed, sender=User, dispatch_uid="permatrix_user_saved")
+post_delete.connect(user_changed, sender=User, dispatch_uid="permatrix_user_deleted")
+# Custom user models without PermissionsMixin have no groups or permissions
+for field_name in ("groups", "user_permissions"):
+    if hasattr(User, field_name):
+        m2m_changed.connect(user_changed, sender=getattr(User, field_name).through,
+                            dispatch_uid="permatrix_user_{}".format(field_name))
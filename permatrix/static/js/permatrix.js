@@ -14,6 +14,112 @@ function getCookie(name) {
     return cookieValue;
 }
 
+function escapeHtml(text) {
+    return String(text).replace(/&/g, "&amp;").replace(/</g, "&lt;").replace(/>/g, "&gt;")
+        .replace(/"/g, "&quot;").replace(/'/g, "&#39;");
+}
+
+function renderMatrixRows(table, payload) {
+    // Build the group rows from the JSON matrix data, decoding each group's
+    // base64 grant bitmap against the permission columns
+    var permissions = payload.permissions;
+    var columns = [];
+    for (var i = 0; i < permissions.length; i++) {
+        columns.push("<td data-permission_id='" + permissions[i].id +
+            "' data-permission_name='" + escapeHtml(permissions[i].name) +
+            "' data-module='" + escapeHtml(permissions[i].module) + "'");
+    }
+    var slim = table.closest(".slim-cells").length > 0;
+    var html = [];
+    $.each(payload.groups, function(i, group){
+        var bits = atob(group.grants);
+        var group_attrs = " data-group_id='" + group.id + "' data-group_name='" + escapeHtml(group.name) + "'";
+        html.push((slim ? "<tr" + group_attrs + ">" : "<tr>") + "<td>" + escapeHtml(group.name) + "</td>");
+        for (var c = 0; c < columns.length; c++) {
+            var granted = bits.charCodeAt(c >> 3) & (1 << (c & 7));
+            if (slim) {
+                html.push(granted ? "<td class='perm_yes'></td>" : "<td></td>");
+            } else {
+                html.push(columns[c] + group_attrs + (granted ? " class='permission-cell perm_yes'></td>" : " class='permission-cell'></td>"));
+            }
+        }
+        html.push("</tr>");
+    });
+    table.append(html.join(""));
+}
+
+function cellInfo(cell) {
+    // Full cells carry their own data, slim cells take the group from their
+    // row and the permission from the header cell in the same column
+    if (cell.is("[data-permission_id]")) {
+        return {group_id: cell.data("group_id"), group_name: cell.data("group_name"),
+                permission_id: cell.data("permission_id"), permission_name: cell.data("permission_name")};
+    }
+    var row = cell.parent();
+    var header = cell.closest("table").find("tr.permission-row").children().eq(cell.index());
+    return {group_id: row.data("group_id"), group_name: row.data("group_name"),
+            permission_id: header.data("permission_id"), permission_name: header.data("permission_name")};
+}
+
+function findCell(group_id, permission_id) {
+    var cell = $(".permission-cell[data-group_id='" + group_id + "'][data-permission_id='" + permission_id + "']");
+    var container = $(".permatrix-container.slim-cells");
+    if (cell.length || !container.length) {
+        return cell;
+    }
+    var header = container.find("tr.permission-row > [data-permission_id='" + permission_id + "']");
+    if (!header.length) {
+        return $();
+    }
+    return container.find("tr[data-group_id='" + group_id + "']").children().eq(header.index());
+}
+
+function applyChanges(changes) {
+    // Patch cells changed by other users, leaving cells with pending actions
+    $.each(changes, function(i, change){
+        var cell = findCell(change[0], change[1]);
+        if (!cell.length || cell.hasClass("perm_add") || cell.hasClass("perm_remove")) {
+            return;
+        }
+        if (change[2] == "add") {
+            cell.addClass("perm_yes");
+        } else {
+            cell.removeClass("perm_yes");
+        }
+    });
+}
+
+function pollChanges(container) {
+    setTimeout(function(){
+        $.getJSON(container.data("changes-url"), {since: container.data("changes-seq")}).done(function(payload){
+            if (payload.reset) {
+                $(".actions").append("<p>Permissions have been changed elsewhere, reload to see them</p>");
+                return;
+            }
+            applyChanges(payload.changes);
+            container.data("changes-seq", payload.seq);
+            pollChanges(container);
+        }).fail(function(){
+            pollChanges(container);
+        });
+    }, container.data("changes-interval") * 1000);
+}
+
+$(function(){
+    var container = $(".permatrix-container");
+    if (container.is("[data-matrix-url]")) {
+        $.getJSON(container.data("matrix-url")).done(function(payload){
+            renderMatrixRows(container.find("table"), payload);
+            if (container.is("[data-changes-url]")) {
+                container.data("changes-seq", payload.seq);
+                pollChanges(container);
+            }
+        });
+    } else if (container.is("[data-changes-url]")) {
+        pollChanges(container);
+    }
+});
+
 function restoreCell(cell) {
     // Restore cell to original style
     if (cell.hasClass("perm_add")) {
@@ -26,23 +132,24 @@ function restoreCell(cell) {
     cell.data("action").remove();
 }
 
-$(document).on("click", ".permission-cell", function(){
+$(document).on("click", ".permission-cell, .slim-cells tr[data-group_id] > td + td", function(){
     var t = $(this);
+    var info = cellInfo(t);
     var actions_container = $("#pending-actions");
     var action_elem = $("<li>");
-    action_elem.data("permission", t.data("permission_id"));
-    action_elem.data("group", t.data("group_id"));
+    action_elem.data("permission", info.permission_id);
+    action_elem.data("group", info.group_id);
     if (t.hasClass("perm_add") || t.hasClass("perm_remove")) {
         restoreCell(t);
         updateNoPermsMessage();
         return false
     } else if (t.hasClass("perm_yes")) {
-        action_elem.text("Remove permission " + t.data("permission_name") + " from group " + t.data("group_name"));
+        action_elem.text("Remove permission " + info.permission_name + " from group " + info.group_name);
         action_elem.data("action", "remove");
         t.removeClass("perm_yes");
         t.addClass("perm_remove");
     } else {
-        action_elem.text("Add permission " + t.data("permission_name") + " to group " + t.data("group_name"));
+        action_elem.text("Add permission " + info.permission_name + " to group " + info.group_name);
         action_elem.data("action", "add");
         t.addClass("perm_add");
     }
@@ -76,24 +183,144 @@ $(document).on("click", ".submit-perms", function(){
         $(".perm_remove").removeClass("perm_remove");
         // Remove all perm_add classes and replace with perm_yes
         $(".perm_add").removeClass("perm_add").addClass("perm_yes");
-    }).fail(function(){
-        $(".actions").append("<p>An error occured</p>")
+    }).fail(function(xhr){
+        var errors = xhr.responseJSON && xhr.responseJSON.errors;
+        if (!errors) {
+            $(".actions").append("<p>An error occured</p>");
+            return;
+        }
+        // Errors are keyed by the index of the change in the submitted list
+        var items = $("#pending-actions li");
+        $.each(errors, function(index, messages){
+            var item = items.eq(parseInt(index, 10));
+            if (item.length) {
+                item.find(".errors").remove();
+                item.append($("<span class='errors'>").text(" - " + messages.join(", ")));
+            } else {
+                $(".actions").append($("<p>").text(messages.join(", ")));
+            }
+        });
     })
 });
 
+function nextLoadedModule(module) {
+    // Modules are sorted by app label, so a module's columns go before those
+    // of the first loaded module after it
+    var next = null;
+    $(".module_checkbox").each(function(){
+        var other = String($(this).data("module"));
+        if ($(this).data("loaded") && other > module && (next === null || other < next)) {
+            next = other;
+        }
+    });
+    return next;
+}
+
+function insertCells(row, html, before) {
+    var anchor = before === null ? $() : row.children("[data-module='" + before + "']").first();
+    if (anchor.length) {
+        anchor.before(html);
+    } else {
+        row.append(html);
+    }
+}
+
+function spliceModule(table, module, payload) {
+    var before = nextLoadedModule(module);
+    var permission_row = table.find("tr.permission-row");
+    // Group cells may not name their module, so splice them by column position
+    var anchor = before === null ? $() : permission_row.children("[data-module='" + before + "']").first();
+    var position = anchor.length ? anchor.index() : -1;
+    insertCells(table.find("tr.module-row"), payload.header.modules, before);
+    insertCells(table.find("tr.model-row"), payload.header.models, before);
+    insertCells(permission_row, payload.header.permissions, before);
+    // Rows come in the order of the groups on the page
+    var rows = table.find("tr").not(".module-row, .model-row, .permission-row");
+    $.each(payload.rows, function(i, html){
+        var cell = position < 0 ? $() : rows.eq(i).children().eq(position);
+        if (cell.length) {
+            cell.before(html);
+        } else {
+            rows.eq(i).append(html);
+        }
+    });
+}
+
+function loadModule(checkbox) {
+    // Fetch the columns of a module that was not rendered with the page
+    var container = $(".permatrix-container");
+    var module = String(checkbox.data("module"));
+    checkbox.prop("disabled", true);
+    $.getJSON(container.data("columns-url"), {apps: module}).done(function(payload){
+        spliceModule(container.find("table"), module, payload);
+        checkbox.data("loaded", true);
+        // Splicing moves the columns of modules after this one
+        updateModuleStyle();
+    }).fail(function(){
+        checkbox.prop("checked", false);
+    }).always(function(){
+        checkbox.prop("disabled", false);
+    });
+}
+
+function moduleColumns(container) {
+    // First and last position of each module's columns, from one pass over
+    // the permission header row
+    var columns = {};
+    container.find("tr.permission-row").children("[data-module]").each(function(){
+        var module = String($(this).data("module"));
+        var position = $(this).index();
+        if (!columns[module]) {
+            columns[module] = [position, position];
+        }
+        columns[module][1] = position;
+    });
+    return columns;
+}
+
+function updateModuleStyle() {
+    // Hide every unchecked module with one generated stylesheet, so toggling
+    // is a single style change however many cells the table has. Header
+    // cells name their module, other cells are hidden by column position
+    var container = $(".permatrix-container");
+    var style = $("#permatrix-module-style");
+    if (!style.length) {
+        style = $("<style id='permatrix-module-style'>").appendTo("head");
+    }
+    var columns = moduleColumns(container);
+    var selectors = [];
+    $(".module_checkbox").not(":checked").each(function(){
+        var module = String($(this).data("module"));
+        selectors.push(".permatrix-container [data-module='" + module + "']");
+        if (columns[module]) {
+            selectors.push(".permatrix-container tr:not(.module-row):not(.model-row) > " +
+                ":nth-child(n+" + (columns[module][0] + 1) + "):nth-child(-n+" + (columns[module][1] + 1) + ")");
+        }
+    });
+    style.text(selectors.length ? selectors.join(",\n") + " { display: none; }" : "");
+}
+
 $(document).on("change", ".module_checkbox", function(){
     var t = $(this);
-    var module = t.data("module");
-    console.log(module);
-    if (t.is(":checked")){
-        $(".permatrix-container").find('*[data-module="'+module+'"]').removeClass("hidden")
-    } else {
-        $(".permatrix-container").find('*[data-module="'+module+'"]').addClass("hidden")
+    if (t.is(":checked") && !t.data("loaded")) {
+        loadModule(t);
+        return;
     }
+    updateModuleStyle();
 });
 
 $(document).on("click", ".hide-all-modules", function(){
-    $(".module_checkbox").prop("checked", false).trigger("change");
+    $(".module_checkbox").prop("checked", false);
+    updateModuleStyle();
+});
+
+$(document).on("click", ".show-all-modules", function(){
+    var boxes = $(".module_checkbox");
+    boxes.filter(function(){ return $(this).data("loaded"); }).prop("checked", true);
+    updateModuleStyle();
+    boxes.filter(function(){ return !$(this).data("loaded"); }).prop("checked", true).each(function(){
+        loadModule($(this));
+    });
 });
 
 function updateNoPermsMessage(){
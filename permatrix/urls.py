@@ -0,0 +1,18 @@
+try:
+    from django.urls import re_path as url
+except ImportError:
+    from django.conf.urls import url
+
+from permatrix.views import (PermissionMatrixView, PermissionMatrixDataView, PermissionChangesView,
+                             PermissionMatrixExportView, PermissionColumnsView, UserPermissionMatrixView,
+                             PermissionHoldersView)
+
+urlpatterns = [
+    url(r"^$", PermissionMatrixView.as_view(), name="permatrix"),
+    url(r"^data/$", PermissionMatrixDataView.as_view(), name="permatrix-data"),
+    url(r"^changes/$", PermissionChangesView.as_view(), name="permatrix-changes"),
+    url(r"^columns/$", PermissionColumnsView.as_view(), name="permatrix-columns"),
+    url(r"^export/$", PermissionMatrixExportView.as_view(), name="permatrix-export"),
+    url(r"^users/$", UserPermissionMatrixView.as_view(), name="permatrix-users"),
+    url(r"^holders/$", PermissionHoldersView.as_view(), name="permatrix-holders"),
+]
@@ -1,12 +1,34 @@
+from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group, Permission
 from django.views.generic import View
 from django.shortcuts import render
+from django.template.loader import render_to_string
 from django.utils.safestring import mark_safe
-from django.http import HttpResponse
+from django.utils.html import conditional_escape, escape
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
 from django import forms
 from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.db import IntegrityError
 
+from itertools import chain
+import base64
+import hashlib
 import json
+import tempfile
+
+try:
+    from django.urls import reverse
+except ImportError:
+    from django.core.urlresolvers import reverse
+
+from permatrix import cache, export, index
+from permatrix.bulk import PermissionChangeSet
+from permatrix.instrumentation import NullTimer, PhaseTimer
+from permatrix.matrix import ColumnIndex, MembershipSnapshot, PermissionMatrix
+from permatrix.models import PermissionChange
+from permatrix.renderers import get_renderer_class, RowRenderer, UserRowRenderer  # noqa
 
 try:
     jquery_path = settings.PERMATRIX_JQUERY_PATH
@@ -17,6 +39,34 @@ except AttributeError:
 EXCLUDE_MODULES = {"sites", "sessions", "contenttypes", "djcelery", "django", "south", "admin"}
 EXCLUDE_MODULES = {}
 
+# Placeholder marking where group rows are inserted into a streamed page
+STREAM_MARKER = "<!--permatrix-rows-->"
+
+
+class StaffRequiredMixin(object):
+    """
+    Restrict a view to active staff users holding all of the permissions in
+    required_permissions, and for requests that make changes, those in
+    change_permissions too, answering 403 Forbidden to anyone else
+    """
+    required_permissions = ("auth.view_group",)
+    change_permissions = ()
+
+    def get_required_permissions(self, request):
+        if request.method in ("GET", "HEAD", "OPTIONS"):
+            return tuple(self.required_permissions)
+        return tuple(self.required_permissions) + tuple(self.change_permissions)
+
+    def has_access(self, request):
+        user = request.user
+        return user.is_active and user.is_staff and user.has_perms(self.get_required_permissions(request))
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.has_access(request):
+            raise PermissionDenied
+        return super(StaffRequiredMixin, self).dispatch(request, *args, **kwargs)
+
+
 class Cell(object):
 
     def __init__(self, text=""):
@@ -39,11 +89,11 @@ class Cell(object):
     def render_attrs(self):
         if self.classes:
             self.attrs_dict["class"] = " ".join(self.classes)
-        return " ".join(["{}='{}'".format(k, self.attrs_dict[k]) for k in self.attrs_dict])
+        return " ".join(["{}='{}'".format(k, escape(self.attrs_dict[k])) for k in self.attrs_dict])
 
     @property
     def html(self):
-        return mark_safe("<td {}>{}</td>".format(self.render_attrs(), self.text))
+        return mark_safe("<td {}>{}</td>".format(self.render_attrs(), conditional_escape(self.text)))
 
 
 class PermissionCell(Cell):
@@ -63,7 +113,38 @@ class PermNameCell(Cell):
 
     @property
     def html(self):
-        return mark_safe("<td {}><span class='vertical-text'>{}</span></td>".format(self.render_attrs(), self.text))
+        return mark_safe("<td {}><span class='vertical-text'>{}</span></td>".format(
+            self.render_attrs(), conditional_escape(self.text)))
+
+
+class PermissionRow(object):
+    """
+    Row of permission cells for one group, rendered directly from the group's
+    bitset in the matrix rather than from individual cell objects
+    """
+
+    def __init__(self, group, matrix, renderer):
+        self.group = group
+        self.matrix = matrix
+        self.renderer = renderer
+        self.cached_html = None
+
+    def render(self):
+        return self.renderer.render(self.group, self.matrix.row(self.group.pk))
+
+    @property
+    def fingerprint(self):
+        """
+        Digest of the group's name and grants, the data the row is rendered from
+        """
+        content = u"{}\0".format(self.group.name).encode("utf-8") + bytes(self.matrix.rows[self.group.pk])
+        return hashlib.md5(content).hexdigest()
+
+    @property
+    def html(self):
+        if self.cached_html is None:
+            self.cached_html = self.render()
+        return mark_safe(self.cached_html)
 
 
 class GroupPermissionForm(forms.Form):
@@ -91,43 +172,297 @@ class GroupPermissionForm(forms.Form):
             data["group"].permissions.add(data["permission"])
         else:
             data["group"].permissions.remove(data["permission"])
-
-class PermissionMatrixView(View):
-
-    def __init__(self):
+        cache.groups_changed([data["group"].pk])
+
+
+class PermissionMatrixView(StaffRequiredMixin, View):
+    template_name = "permatrix/base.html"
+    # Posting changes to the matrix needs permission to change groups
+    change_permissions = ("auth.change_group",)
+    # Stream group rows to the client as they are read instead of rendering
+    # the whole page up front
+    streaming = getattr(settings, "PERMATRIX_STREAMING", False)
+    # Number of groups read and rendered at a time when streaming
+    stream_chunk_size = 100
+    # Leave group rows to permatrix.js, rendered from the JSON data view
+    client_render = getattr(settings, "PERMATRIX_CLIENT_RENDER", False)
+    data_url_name = "permatrix-data"
+    changes_url_name = "permatrix-changes"
+    columns_url_name = "permatrix-columns"
+    # Seconds between polls for changes made by other users, 0 to disable
+    changes_interval = getattr(settings, "PERMATRIX_CHANGES_INTERVAL", 10)
+    # Time the phases of each request, publishing them through the
+    # phase_finished signal and a Server-Timing header
+    instrument = getattr(settings, "PERMATRIX_INSTRUMENTATION", True)
+    # Backend for rendering group rows: python, django, jinja2, slim for compact
+    # cells without data attributes, or the dotted path of a renderer class
+    row_renderer = getattr(settings, "PERMATRIX_RENDERER", "python")
+    render_rows = True
+    # Default number of groups per page, None to show all groups
+    paginate_by = getattr(settings, "PERMATRIX_GROUPS_PER_PAGE", None)
+    # Database alias for matrix reads on GET, None to read from the default
+    # database. Changes are always written to the default database
+    read_database = getattr(settings, "PERMATRIX_READ_DATABASE", None)
+    # Seconds the read database may lag the default. Clients read from the
+    # default for this long after posting changes, and cached data read from
+    # the read database expires after it
+    replica_lag = getattr(settings, "PERMATRIX_REPLICA_LAG", 10)
+    # Cookie marking clients that recently posted changes
+    primary_cookie = "permatrix_primary"
+    # App labels whose columns are rendered when the page is opened, None for
+    # all apps. Other modules are loaded when their checkbox is ticked
+    default_apps = getattr(settings, "PERMATRIX_DEFAULT_APPS", None)
+    # Read groups and memberships from a snapshot shared by all processes
+    # through the cache, patched in place when permissions change. The
+    # snapshot holds every group, so the cache must accept large items
+    snapshot = getattr(settings, "PERMATRIX_SNAPSHOT", False)
+    # Version counters the response depends on, for the ETag
+    etag_versions = (cache.HEADERS, cache.MATRIX)
+
+    def __init__(self, **kwargs):
         self.header_data = {}
         self.group_rows = []
-        super(View, self).__init__()
+        self.columns = None
+        self.all_columns = None
+        self.matrix = None
+        self.renderer = None
+        self.database = None
+        self.change_seq = 0
+        self.app_labels = None
+        self.group_prefix = ""
+        self.offset = 0
+        self.limit = None
+        super(PermissionMatrixView, self).__init__(**kwargs)
+        self.limit = self.paginate_by
+        self.timer = PhaseTimer(self.__class__) if self.instrument else NullTimer()
+
+    def setup(self, request, *args, **kwargs):
+        super(PermissionMatrixView, self).setup(request, *args, **kwargs)
+        if request.method in ("GET", "HEAD"):
+            self.database = self.get_read_database(request)
+
+    def get_read_database(self, request):
+        """
+        Choose the database to read the matrix from, sticking to the default
+        for clients that have just posted changes so they see their own edits
+        """
+        if self.read_database is None or request.COOKIES.get(self.primary_cookie):
+            return None
+        return self.read_database
+
+    def using(self, queryset):
+        """
+        Route a matrix read to the database chosen for this request
+        """
+        if self.database is None:
+            return queryset
+        return queryset.using(self.database)
+
+    @property
+    def cache_timeout(self):
+        # Data read from a lagging database is only cached until it catches up
+        return None if self.database is None else self.replica_lag
+
+    def dispatch(self, request, *args, **kwargs):
+        response = super(PermissionMatrixView, self).dispatch(request, *args, **kwargs)
+        if self.timer.phases:
+            response["Server-Timing"] = self.timer.server_timing()
+        return response
 
     def get(self, request):
         """
-        Render the main permission matrix view on template
+        Render the main permission matrix view on template, or reply 304 Not
+        Modified when the client already has the current version
         """
-        self.build_headers(self.get_permissions())
-        self.calculate_colspan()
+        self.read_filters(request)
+        etag = self.get_etag(request)
+        if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+        if etag and if_none_match and (if_none_match.strip() == "*" or etag in parse_etags(if_none_match)):
+            response = HttpResponseNotModified()
+        else:
+            response = self.render_matrix(request)
+        if etag:
+            response["ETag"] = etag
+        return response
+
+    def get_etag(self, request):
+        """
+        Fingerprint the response from the maintained version counters and the
+        request, without reading the matrix itself. Returns None for reads
+        from a lagging database, whose content may be older than the counters
+        """
+        if self.database is not None:
+            return None
+        user = getattr(request, "user", None)
+        fingerprint = ":".join(str(part) for part in (
+            self.__class__.__name__,
+            ":".join(str(cache.get_version(name)) for name in self.etag_versions),
+            getattr(user, "pk", None),
+            self.streaming,
+            self.client_render,
+            request.GET.urlencode(),
+        ))
+        return quote_etag(hashlib.md5(fingerprint.encode("utf-8")).hexdigest())
+
+    def render_matrix(self, request):
+        # Read the journal position before the matrix, so that no change made
+        # while the matrix is read can be missed by the client
+        self.change_seq = PermissionChange.objects.db_manager(self.database).latest_seq()
+        self.get_columns()
+        if self.client_render:
+            data_url = reverse(self.data_url_name)
+            if request.GET:
+                data_url += "?" + request.GET.urlencode()
+            with self.timer.phase("render"):
+                return render(request, self.template_name, self.get_context_data(data_url=data_url))
+        if self.streaming:
+            return self.stream(request)
         self.attach_groups()
+        with self.timer.phase("render"):
+            return render(request, self.template_name, self.get_context_data())
+
+    def get_context_data(self, **kwargs):
         data = {
-            "modules": self.all_modules,  # Convert generator to list to allow reuse
-            "models": self.all_models,
-            "permissions": self.all_permissions,
+            "modules": self.columns.modules,
+            "models": self.columns.models,
+            "permissions": self.columns.permissions,
             "groups": self.group_rows,
-            "jq_path": jquery_path
+            "jq_path": jquery_path,
+            "changes_url": reverse(self.changes_url_name),
+            "change_seq": self.change_seq,
+            "changes_interval": self.changes_interval,
+            "module_choices": self.get_module_choices(),
+            "slim_cells": getattr(get_renderer_class(self.row_renderer), "slim", False),
+            "columns_url": self.get_columns_url(),
         }
-        return render(request, "permatrix/base.html", data)
+        data.update(self.get_page_urls())
+        data.update(kwargs)
+        return data
 
-    def post(self, request):
-        data = json.loads(request.POST["data"])
-        all_forms = [GroupPermissionForm(item) for item in data]
-        if all(f.is_valid() for f in all_forms):
-            for f in all_forms:
-                f.save()
-        else:
-            return HttpResponse(status_code=300)
+    def read_filters(self, request):
+        """
+        Read the window of the matrix to show from the query string: apps is a
+        comma separated list of app labels, group a group name prefix, and
+        offset and limit select a page of the matching groups
+        """
+        apps = request.GET.get("apps")
+        if apps:
+            self.app_labels = sorted({label.strip() for label in apps.split(",") if label.strip()})
+        elif self.default_apps is not None:
+            self.app_labels = sorted(self.default_apps)
+        self.group_prefix = request.GET.get("group", "")
+        self.offset = self._int_param(request, "offset", 0)
+        self.limit = self._int_param(request, "limit", self.limit)
+
+    @staticmethod
+    def _int_param(request, name, default):
+        try:
+            return max(int(request.GET[name]), 0)
+        except (KeyError, ValueError):
+            return default
+
+    @property
+    def windowed(self):
+        return bool(self.offset) or self.limit is not None
 
-        return HttpResponse()
+    def get_module_choices(self):
+        """
+        List every module for the module checkboxes, marking those whose
+        columns are on the page. Without a columns URL to load other modules
+        from, only the modules on the page are listed
+        """
+        if self.all_columns is None:
+            return []
+        choices = [{"app_label": node["ct"].app_label,
+                    "loaded": self.app_labels is None or node["ct"].app_label in self.app_labels}
+                   for node in self.all_columns.modules]
+        if self.columns_url_name is None:
+            choices = [choice for choice in choices if choice["loaded"]]
+        return choices
+
+    def get_columns_url(self):
+        """
+        URL for loading the columns of another module for the same groups,
+        or None if modules can not be loaded later
+        """
+        if self.columns_url_name is None:
+            return None
+        params = self.request.GET.copy() if getattr(self, "request", None) else None
+        url = reverse(self.columns_url_name)
+        if params:
+            params.pop("apps", None)
+            if params:
+                url += "?" + params.urlencode()
+        return url
+
+    def get_page_urls(self):
+        urls = {}
+        if self.limit is None:
+            return urls
+        params = self.request.GET.copy()
+        if self.offset:
+            params["offset"] = max(self.offset - self.limit, 0)
+            urls["previous_url"] = "?" + params.urlencode()
+        if self.limit and len(self.group_rows) >= self.limit:
+            params["offset"] = self.offset + self.limit
+            urls["next_url"] = "?" + params.urlencode()
+        return urls
+
+    def row_variant(self):
+        """
+        Identify the columns rows are rendered with and the database they are
+        read from, for the row cache key
+        """
+        variant = self.row_renderer
+        if self.database is not None:
+            variant = "{}@{}".format(variant, self.database)
+        if self.app_labels is None:
+            return variant
+        return "{}:{}".format(variant, hashlib.md5(",".join(self.app_labels).encode("utf-8")).hexdigest())
+
+    def stream(self, request):
+        """
+        Send the page chrome and headers first, then the group rows as they
+        are read from the database
+        """
+        page = render_to_string(
+            self.template_name, self.get_context_data(stream_marker=mark_safe(STREAM_MARKER)), request=request
+        )
+        head, tail = page.split(STREAM_MARKER, 1)
+        return StreamingHttpResponse(chain([head], self.iter_rows(), [tail]))
+
+    def post(self, request):
+        try:
+            data = json.loads(request.POST["data"])
+        except (KeyError, ValueError):
+            return self.json_response({"errors": {"data": ["Invalid change data"]}}, status=400)
+        if not isinstance(data, list):
+            return self.json_response({"errors": {"data": ["Change data must be a list"]}}, status=400)
+        changes = PermissionChangeSet(data)
+        with self.timer.phase("validate"):
+            valid = changes.is_valid()
+        if not valid:
+            return self.json_response({"errors": changes.errors}, status=400)
+        try:
+            with self.timer.phase("apply"):
+                changes.save()
+        except IntegrityError:
+            return self.json_response({"errors": {"data": ["Permissions were changed concurrently"]}}, status=409)
+        response = self.json_response({
+            "added": sum(1 for change in changes.changes if change[2] == "add"),
+            "removed": sum(1 for change in changes.changes if change[2] == "remove"),
+        })
+        if self.read_database is not None:
+            response.set_cookie(self.primary_cookie, "1", max_age=self.replica_lag, httponly=True)
+        return response
+
+    @staticmethod
+    def json_response(data, status=200):
+        return HttpResponse(json.dumps(data, separators=(",", ":")), content_type="application/json", status=status)
 
     def get_permissions(self):
-        return Permission.objects.exclude(content_type__app_label__in=EXCLUDE_MODULES).select_related("content_type")
+        return self.using(Permission.objects.exclude(
+            content_type__app_label__in=EXCLUDE_MODULES).select_related("content_type"))
 
     def build_headers(self, permissions):
         # Assemble top row - modules
@@ -146,7 +481,7 @@ class PermissionMatrixView(View):
             model_container = app_container["children"][model_name]
             full_name = "{}.{}".format(app_label, perm.codename)
             cell = PermNameCell(perm.codename)
-            cell.data(module=perm.content_type.app_label)
+            cell.data(module=perm.content_type.app_label, permission_id=perm.pk, permission_name=full_name)
             model_container["children"][perm.codename] = {"permission": perm, "groups": {}, "name": full_name, "cell": cell}
 
     def all_permissions(self):
@@ -163,18 +498,188 @@ class PermissionMatrixView(View):
             for model_name in sorted(module["children"]):
                 yield module["children"][model_name]
 
+    def get_groups(self):
+        groups = self.using(Group.objects.order_by("name", "pk"))
+        if self.group_prefix:
+            groups = groups.filter(name__startswith=self.group_prefix)
+        return self.window(groups)
+
+    def window(self, queryset):
+        if self.limit is not None:
+            return queryset[self.offset:self.offset + self.limit]
+        elif self.offset:
+            return queryset[self.offset:]
+        return queryset
+
+    def filter_apps(self, rows):
+        """
+        Restrict rows of a permission through table to the visible apps
+        """
+        rows = rows.exclude(permission__content_type__app_label__in=EXCLUDE_MODULES)
+        if self.app_labels is not None:
+            rows = rows.filter(permission__content_type__app_label__in=self.app_labels)
+        return rows
+
+    def get_membership_queryset(self, group_ids=None):
+        """
+        Group permission assignments from the through table, restricted to the
+        visible apps and groups
+        """
+        rows = self.filter_apps(self.using(Group.permissions.through.objects.all()))
+        if group_ids is not None:
+            rows = rows.filter(group_id__in=group_ids)
+        elif self.group_prefix:
+            rows = rows.filter(group__name__startswith=self.group_prefix)
+        return rows
+
+    def get_memberships(self, group_ids=None):
+        """
+        Read group permission assignments from the through table in a single
+        query, returning a dict of group id to set of permission ids
+        """
+        memberships = {}
+        rows = self.get_membership_queryset(group_ids).values_list("group_id", "permission_id")
+        for group_id, permission_id in rows.iterator():
+            memberships.setdefault(group_id, set()).add(permission_id)
+        return memberships
+
+    def build_columns(self):
+        """
+        Materialise the sorted header tree into a column index, so that it is
+        only ordered once per request
+        """
+        self.columns = ColumnIndex(self.all_modules(), self.all_models(), self.all_permissions())
+        # Render header cells now, so cached indexes carry the finished HTML
+        for node in chain(self.columns.modules, self.columns.models, self.columns.permissions):
+            node["html"] = node["cell"].html
+        return self.columns
+
+    def get_columns(self):
+        """
+        Get the column index from the cache, only querying permissions and
+        rebuilding the header tree when the permission table has changed
+        """
+        def builder():
+            with self.timer.phase("get_permissions"):
+                permissions = list(self.get_permissions())
+            with self.timer.phase("build_headers"):
+                self.build_headers(permissions)
+            with self.timer.phase("calculate_colspan"):
+                self.calculate_colspan()
+            with self.timer.phase("build_columns"):
+                return self.build_columns()
+        self.columns = self.all_columns = cache.get_columns(builder, self.database, self.cache_timeout)
+        if self.app_labels is not None:
+            self.columns = self.columns.restrict(self.app_labels)
+        return self.columns
+
+    def get_renderer(self):
+        if self.renderer is None:
+            self.renderer = get_renderer_class(self.row_renderer)(self.columns.permissions)
+        return self.renderer
+
+    def get_snapshot(self):
+        """
+        Get the membership snapshot of every group over every column from the
+        cache, reading it in two queries when the matrix has changed in a way
+        that could not be patched
+        """
+        columns = self.all_columns or self.columns
+
+        def builder():
+            groups = list(self.using(Group.objects.order_by("name", "pk")).values_list("pk", "name"))
+            memberships = {}
+            # The snapshot is shared by requests for any apps, so it is never
+            # restricted to the apps of this one
+            rows = self.using(Group.permissions.through.objects.exclude(
+                permission__content_type__app_label__in=EXCLUDE_MODULES))
+            for group_id, permission_id in rows.values_list("group_id", "permission_id").iterator():
+                memberships.setdefault(group_id, set()).add(permission_id)
+            return MembershipSnapshot.build(columns.pks, groups, memberships)
+        return cache.get_snapshot(builder, self.database, self.cache_timeout)
+
     def attach_groups(self):
-        groups = Group.objects.all().order_by("name")
+        if self.columns is None:
+            self.build_columns()
+        if self.snapshot:
+            self.attach_snapshot()
+        else:
+            with self.timer.phase("get_memberships"):
+                groups = list(self.get_groups())
+                memberships = self.get_memberships([g.pk for g in groups] if self.windowed else None)
+            with self.timer.phase("attach_groups"):
+                self.matrix = PermissionMatrix(self.columns.pks, self.columns.positions)
+                renderer = self.get_renderer()
+                for g in groups:
+                    self.matrix.add_row(g.pk, memberships.get(g.pk, ()))
+                    self.group_rows.append(PermissionRow(g, self.matrix, renderer))
+        if self.render_rows:
+            with self.timer.phase("render_rows"):
+                cache.cache_rows(self.group_rows, self.row_variant(), self.cache_timeout)
+
+    def attach_snapshot(self):
+        """
+        Attach the window of groups from the membership snapshot, copying their
+        bitmaps into the matrix without querying the database
+        """
+        with self.timer.phase("get_memberships"):
+            snapshot = self.get_snapshot()
+        with self.timer.phase("attach_groups"):
+            self.matrix = PermissionMatrix(self.columns.pks, self.columns.positions)
+            runs = None
+            if snapshot.columns != self.columns.pks:
+                runs = self.matrix.column_runs(snapshot.columns)
+            renderer = self.get_renderer()
+            for pk, name in snapshot.window(self.group_prefix, self.offset, self.limit):
+                self.matrix.add_bitmap_row(pk, snapshot.rows[pk], runs)
+                self.group_rows.append(PermissionRow(Group(pk=pk, name=name), self.matrix, renderer))
+
+    def iter_memberships(self):
+        """
+        Yield each group in name order with the ids of its permissions, merging
+        groups and memberships from two ordered server side cursors
+        """
+        groups = self.get_groups()
+        group_ids = None
+        if self.windowed:
+            groups = list(groups)
+            group_ids = [g.pk for g in groups]
+        else:
+            groups = groups.iterator()
+        memberships = self.get_membership_queryset(group_ids).order_by(
+            "group__name", "group_id"
+        ).values_list("group_id", "permission_id").iterator()
+        pending = next(memberships, None)
         for g in groups:
-            data = {"group": g, "cells": []}
-            permission_set = {perm.pk for perm in g.permissions.all()}
-            for permission in self.all_permissions():
-                cell = PermissionCell("", permission["permission"].pk in permission_set)
-                cell.data(permission_id=permission["permission"].id, permission_name=permission["name"])
-                cell.data(group_id=g.id, group_name=g.name)
-                cell.data(module=permission["permission"].content_type.app_label)
-                data["cells"].append(cell)
-            self.group_rows.append(data)
+            permission_ids = []
+            while pending is not None and pending[0] == g.pk:
+                permission_ids.append(pending[1])
+                pending = next(memberships, None)
+            yield g, permission_ids
+
+    def iter_rows(self):
+        """
+        Yield rendered group rows, holding at most one chunk of groups in memory
+        """
+        chunk = []
+        for g, permission_ids in self.iter_memberships():
+            chunk.append((g, permission_ids))
+            if len(chunk) >= self.stream_chunk_size:
+                for html in self.render_chunk(chunk):
+                    yield html
+                chunk = []
+        for html in self.render_chunk(chunk):
+            yield html
+
+    def render_chunk(self, chunk):
+        matrix = PermissionMatrix(self.columns.pks, self.columns.positions)
+        renderer = self.get_renderer()
+        rows = []
+        for g, permission_ids in chunk:
+            matrix.add_row(g.pk, permission_ids)
+            rows.append(PermissionRow(g, matrix, renderer))
+        cache.cache_rows(rows, self.row_variant(), self.cache_timeout)
+        return [row.cached_html for row in rows]
 
     def calculate_colspan(self):
         for module in self.all_modules():
@@ -182,3 +687,249 @@ class PermissionMatrixView(View):
                 model["cell"].attr(colspan=len(model["children"]))
             module["cell"].attr(colspan=sum(model["cell"].attr("colspan") for model in module["children"].values()))
 
+
+class PermissionMatrixDataView(PermissionMatrixView):
+    """
+    Read only JSON version of the matrix. Columns are listed once and each
+    group's grants are sent as a base64 encoded bitmap over the columns, with
+    bit n of the bitmap (least significant bit first) set for column n
+    """
+    # Groups are sent as bitmaps, so their rows are never rendered
+    render_rows = False
+
+    def render_matrix(self, request):
+        self.change_seq = PermissionChange.objects.db_manager(self.database).latest_seq()
+        self.get_columns()
+        self.attach_groups()
+        data = {
+            "seq": self.change_seq,
+            "modules": [
+                {"module": module["ct"].app_label, "colspan": module["cell"].attr("colspan")}
+                for module in self.columns.modules
+            ],
+            "models": [
+                {"module": model["ct"].app_label, "name": model["ct"].name, "colspan": model["cell"].attr("colspan")}
+                for model in self.columns.models
+            ],
+            "permissions": [
+                {"id": permission["permission"].pk, "name": permission["name"],
+                 "module": permission["permission"].content_type.app_label}
+                for permission in self.columns.permissions
+            ],
+            "groups": [
+                {"id": row.group.pk, "name": row.group.name,
+                 "grants": base64.b64encode(bytes(self.matrix.rows[row.group.pk])).decode("ascii")}
+                for row in self.group_rows
+            ],
+        }
+        return self.json_response(data)
+
+
+class PermissionMatrixExportView(PermissionMatrixView):
+    """
+    Download the matrix, with the same filters as the matrix view, as CSV
+    streamed row by row, or as XLSX with format=xlsx. The workbook is written
+    in constant memory mode to a temporary file and sent from there
+    """
+    http_method_names = ["get", "head", "options"]
+    # Exports hold every group and app unless the request asks for a window,
+    # whatever the page size and default apps of the matrix page
+    paginate_by = None
+    default_apps = None
+
+    def render_matrix(self, request):
+        format = request.GET.get("format", "csv")
+        if format not in export.FORMATS:
+            return self.json_response({"errors": {"format": ["Select either csv or xlsx."]}}, status=400)
+        if format == "csv":
+            response = StreamingHttpResponse(export.iter_csv(self), content_type=export.CONTENT_TYPES[format])
+        else:
+            output = tempfile.TemporaryFile()
+            export.write_xlsx(self, output)
+            output.seek(0)
+            response = FileResponse(output, content_type=export.CONTENT_TYPES[format])
+        response["Content-Disposition"] = "attachment; filename=permatrix.{}".format(format)
+        return response
+
+
+class UserPermissionMatrixView(PermissionMatrixView):
+    """
+    Read only matrix of the effective permissions of each user: their direct
+    permissions, those of all their groups, or every permission for active
+    superusers, as Django's ModelBackend grants them. Effective permissions
+    are computed for all visible users from four queries, however many users
+    there are, by unioning group bitsets rather than asking each user
+    """
+    required_permissions = ("auth.view_group", "auth.view_user")
+    http_method_names = ["get", "head", "options"]
+    streaming = False
+    client_render = False
+    changes_interval = None
+    # The columns view serves group rows, so all modules are rendered up front
+    columns_url_name = None
+    default_apps = None
+    etag_versions = (cache.HEADERS, cache.MATRIX, cache.USERS)
+
+    def __init__(self, **kwargs):
+        self.user_prefix = ""
+        super(UserPermissionMatrixView, self).__init__(**kwargs)
+
+    def read_filters(self, request):
+        """
+        As for groups, with a user parameter to filter by username prefix. The
+        group parameter is ignored, as effective permissions come from all of
+        a user's groups
+        """
+        super(UserPermissionMatrixView, self).read_filters(request)
+        self.group_prefix = ""
+        self.user_prefix = request.GET.get("user", "")
+
+    def get_context_data(self, **kwargs):
+        return super(UserPermissionMatrixView, self).get_context_data(read_only=True, **kwargs)
+
+    def get_users(self):
+        User = get_user_model()
+        users = self.using(User.objects.order_by(User.USERNAME_FIELD, "pk"))
+        if self.user_prefix:
+            users = users.filter(**{User.USERNAME_FIELD + "__startswith": self.user_prefix})
+        return self.window(users)
+
+    def get_user_relations(self, field_name, user_ids=None):
+        """
+        Read a user many to many relation in a single query, returning a dict
+        of user id to list of related ids
+        """
+        field = get_user_model()._meta.get_field(field_name)
+        source, target = field.m2m_field_name(), field.m2m_reverse_field_name()
+        rows = self.using(field.remote_field.through.objects.all())
+        if field_name == "user_permissions":
+            rows = self.filter_apps(rows)
+        if user_ids is not None:
+            rows = rows.filter(**{source + "__in": user_ids})
+        relations = {}
+        for user_id, related_id in rows.values_list(source, target).iterator():
+            relations.setdefault(user_id, []).append(related_id)
+        return relations
+
+    def get_renderer(self):
+        if self.renderer is None:
+            self.renderer = UserRowRenderer(self.columns.permissions)
+        return self.renderer
+
+    def attach_groups(self):
+        if self.columns is None:
+            self.build_columns()
+        with self.timer.phase("get_memberships"):
+            users = list(self.get_users())
+            user_ids = [u.pk for u in users] if self.windowed else None
+            direct = self.get_user_relations("user_permissions", user_ids)
+            user_groups = self.get_user_relations("groups", user_ids)
+            group_ids = None
+            if self.windowed:
+                group_ids = set(chain.from_iterable(user_groups.values()))
+            memberships = self.get_memberships(group_ids)
+        with self.timer.phase("attach_groups"):
+            groups = PermissionMatrix(self.columns.pks, self.columns.positions)
+            for group_id, permission_ids in memberships.items():
+                groups.add_row(group_id, permission_ids)
+            self.matrix = PermissionMatrix(self.columns.pks, self.columns.positions)
+            renderer = self.get_renderer()
+            for user in users:
+                if not getattr(user, "is_active", True):
+                    self.matrix.add_row(user.pk)
+                elif getattr(user, "is_superuser", False):
+                    self.matrix.add_full_row(user.pk)
+                else:
+                    sources = [groups.rows[g] for g in user_groups.get(user.pk, ()) if g in groups]
+                    self.matrix.add_union_row(user.pk, sources, direct.get(user.pk, ()))
+                self.group_rows.append(PermissionRow(user, self.matrix, renderer))
+        if self.render_rows:
+            with self.timer.phase("render_rows"):
+                for row in self.group_rows:
+                    row.cached_html = row.render()
+
+
+class PermissionColumnsView(PermissionMatrixView):
+    """
+    JSON header cells and row cells of the modules named in the apps
+    parameter, for the same window of groups as the matrix page, so that the
+    page can splice in modules that were not rendered when it was opened.
+    Rows are listed in the order of the groups on the page
+    """
+    http_method_names = ["get", "head", "options"]
+    render_rows = False
+
+    def read_filters(self, request):
+        super(PermissionColumnsView, self).read_filters(request)
+        if not request.GET.get("apps"):
+            self.app_labels = []
+
+    def render_matrix(self, request):
+        self.get_columns()
+        self.attach_groups()
+        renderer = self.get_renderer()
+        if not hasattr(renderer, "render_cells"):
+            renderer = RowRenderer(self.columns.permissions)
+        return self.json_response({
+            "modules": [node["ct"].app_label for node in self.columns.modules],
+            "header": {
+                "modules": "".join(node["html"] for node in self.columns.modules),
+                "models": "".join(node["html"] for node in self.columns.models),
+                "permissions": "".join(node["html"] for node in self.columns.permissions),
+            },
+            "groups": [row.group.pk for row in self.group_rows],
+            "rows": [renderer.render_cells(row.group, self.matrix.row(row.group.pk)) for row in self.group_rows],
+        })
+
+
+class PermissionChangesView(StaffRequiredMixin, View):
+    """
+    JSON list of the group permission changes journaled after the sequence
+    number given in the since parameter, as [group id, permission id, action]
+    triples. If there are too many changes, or the journal holds a reset entry,
+    the reply has reset set and the client should reload the matrix instead
+    """
+    required_permissions = ("auth.view_group",)
+    max_changes = 1000
+
+    def get(self, request):
+        try:
+            since = int(request.GET.get("since", 0))
+        except ValueError:
+            return PermissionMatrixView.json_response({"errors": {"since": ["Enter a whole number."]}}, status=400)
+        changes = list(PermissionChange.objects.filter(pk__gt=since)[:self.max_changes + 1])
+        if len(changes) > self.max_changes or any(c.action == PermissionChange.RESET for c in changes):
+            return PermissionMatrixView.json_response({"seq": PermissionChange.objects.latest_seq(), "reset": True})
+        return PermissionMatrixView.json_response({
+            "seq": changes[-1].pk if changes else since,
+            "changes": [change.as_list() for change in changes],
+        })
+
+
+class PermissionHoldersView(StaffRequiredMixin, View):
+    """
+    JSON list of the groups holding the permissions named in the permission
+    parameter, as app_label.codename, which may be repeated or comma
+    separated. match=all requires every permission rather than any of them,
+    and users=1 adds the users holding them
+    """
+    required_permissions = ("auth.view_group", "auth.view_user")
+
+    def get(self, request):
+        names = [name.strip() for value in request.GET.getlist("permission")
+                 for name in value.split(",") if name.strip()]
+        match = request.GET.get("match", index.ANY)
+        errors = {}
+        if not names:
+            errors["permission"] = ["This field is required."]
+        if match not in (index.ANY, index.ALL):
+            errors["match"] = ["Select either any or all."]
+        if errors:
+            return PermissionMatrixView.json_response({"errors": errors}, status=400)
+        try:
+            result = index.holders(names, match, users=request.GET.get("users") in ("1", "true"))
+        except KeyError as e:
+            return PermissionMatrixView.json_response(
+                {"errors": {"permission": ["Unknown permission {}.".format(e.args[0])]}}, status=400)
+        result.update(permissions=names, match=match)
+        return PermissionMatrixView.json_response(result)
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+"""
+Benchmark PermissionMatrixView against synthetic permission tables.
+
+Each size creates APPS apps of MODELS models with PERMS permissions each,
+GROUPS groups and a random DENSITY fraction of group permission grants, then
+measures wall time, query count and peak memory for each phase of building
+and updating the matrix. Results are written as JSON, for example:
+
+    python runbenchmarks.py --size 10x50x4:100 --size 200x1000x4:5000 --output bench.json
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from django.conf import settings
+
+settings.configure(
+    DEBUG=False,
+    USE_TZ=True,
+    DATABASES={
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": ":memory:",
+        }
+    },
+    ROOT_URLCONF="permatrix.urls",
+    INSTALLED_APPS=[
+        "django.contrib.auth",
+        "django.contrib.contenttypes",
+        "django.contrib.sites",
+        "permatrix",
+    ],
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            # Room for every cached row of the largest sizes
+            "OPTIONS": {"MAX_ENTRIES": 1000000},
+        }
+    },
+    SITE_ID=1,
+    STATIC_URL="/static/",
+    TEMPLATES=[
+        {
+            "BACKEND": "django.template.backends.django.DjangoTemplates",
+            "DIRS": ["tests/templates"],
+            "APP_DIRS": True,
+        }
+    ],
+    MIDDLEWARE_CLASSES=(),
+)
+
+import django
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from permatrix import cache as permatrix_cache, export, index
+from permatrix.renderers import get_renderer_class
+from permatrix.views import PermissionMatrixView
+
+APP_PREFIX = "bench_"
+
+
+class Size(object):
+
+    def __init__(self, spec, density):
+        shape, _, groups = spec.partition(":")
+        self.apps, self.models, self.perms = [int(part) for part in shape.split("x")]
+        self.groups = int(groups or 100)
+        self.density = density
+
+    def as_dict(self):
+        return {"apps": self.apps, "models": self.models, "perms": self.perms, "groups": self.groups,
+                "density": self.density, "columns": self.apps * self.models * self.perms}
+
+
+def populate(size, rng):
+    """
+    Replace any previous synthetic data with a new table of the given size
+    """
+    ContentType.objects.filter(app_label__startswith=APP_PREFIX).delete()
+    Group.objects.all().delete()
+    ContentType.objects.bulk_create([
+        ContentType(app_label="{}{:03d}".format(APP_PREFIX, a), model="model{:04d}".format(m))
+        for a in range(size.apps) for m in range(size.models)
+    ])
+    content_types = ContentType.objects.filter(app_label__startswith=APP_PREFIX)
+    Permission.objects.bulk_create([
+        Permission(content_type=ct, codename="perm{}_{}".format(p, ct.model), name="Perm {} {}".format(p, ct.model))
+        for ct in content_types for p in range(size.perms)
+    ], batch_size=5000)
+    Group.objects.bulk_create([Group(name="group{:05d}".format(g)) for g in range(size.groups)], batch_size=5000)
+    permission_ids = list(Permission.objects.values_list("pk", flat=True))
+    through = Group.permissions.through
+    grants = []
+    for group_id in Group.objects.values_list("pk", flat=True):
+        count = int(len(permission_ids) * size.density)
+        grants.extend(through(group_id=group_id, permission_id=p) for p in rng.sample(permission_ids, count))
+    through.objects.bulk_create(grants, batch_size=5000)
+    # Bulk inserts send no signals, so drop anything cached for the old data
+    cache.clear()
+
+
+def measure(func, memory):
+    """
+    Run func, returning its result with elapsed seconds, query count and peak
+    traced memory in bytes (None when memory is not measured)
+    """
+    if memory:
+        tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        start = timeit.default_timer()
+        result = func()
+        seconds = timeit.default_timer() - start
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, {"seconds": seconds, "queries": len(queries), "peak_bytes": peak}
+
+
+def run_phases(size, changes, rng, memory, renderers):
+    factory = RequestFactory()
+    cache.clear()
+    view = PermissionMatrixView()
+    view.request = factory.get("/")
+    results = {}
+
+    def build_headers():
+        view.build_headers(view.get_permissions())
+        view.calculate_colspan()
+        return view.build_columns()
+
+    _, results["build_headers"] = measure(build_headers, memory)
+    _, results["attach_groups"] = measure(view.attach_groups, memory)
+    _, results["render"] = measure(lambda: render_to_string(view.template_name, view.get_context_data()), memory)
+
+    # Throughput of each row rendering backend over the same matrix
+    groups = list(view.get_groups())
+    for name in renderers:
+        def render_rows():
+            renderer = get_renderer_class(name)(view.columns.permissions)
+            return [renderer.render(group, view.matrix.row(group.pk)) for group in groups]
+        rows, phase = measure(render_rows, memory)
+        phase["rows_per_second"] = len(groups) / phase["seconds"] if phase["seconds"] else None
+        phase["bytes"] = sum(len(row.encode("utf-8")) for row in rows)
+        results["render_rows_{}".format(name)] = phase
+
+    # A second request for the same matrix, with headers and rows cached
+    cached = PermissionMatrixView()
+    cached.request = factory.get("/")
+
+    def render_cached():
+        cached.get_columns()
+        cached.attach_groups()
+        return render_to_string(cached.template_name, cached.get_context_data())
+    _, results["render_cached"] = measure(render_cached, memory)
+
+    # Attach groups from the shared membership snapshot, first building it and
+    # then as another process would, reading it from the cache
+    def attach_snapshot():
+        shared = PermissionMatrixView(snapshot=True)
+        shared.get_columns()
+        shared.render_rows = False
+        shared.attach_groups()
+    _, results["snapshot_build"] = measure(attach_snapshot, memory)
+    permatrix_cache._local.clear()
+    _, results["snapshot_shared"] = measure(attach_snapshot, memory)
+
+    # Stream a CSV export, which should use flat memory however many groups
+    exporter = PermissionMatrixView()
+    exporter.limit = None
+    _, results["export_csv"] = measure(lambda: sum(len(line) for line in export.iter_csv(exporter)), memory)
+
+    # Build the permission holders index, then answer a lookup from it
+    names = ["{}.{}".format(node["permission"].content_type.app_label, node["permission"].codename)
+             for node in rng.sample(view.columns.permissions, min(3, len(view.columns)))]
+    _, results["holders_index"] = measure(lambda: index.holders(names[:1]), memory)
+    _, results["holders_all"] = measure(lambda: index.holders(names, index.ALL), memory)
+
+    through = Group.permissions.through
+    held = set(through.objects.values_list("group_id", "permission_id"))
+    group_ids = list(Group.objects.values_list("pk", flat=True))
+    permission_ids = list(Permission.objects.values_list("pk", flat=True))
+    items = {}
+    while len(items) < min(changes, len(group_ids) * len(permission_ids) - len(held)):
+        cell = (rng.choice(group_ids), rng.choice(permission_ids))
+        if cell not in held:
+            items[cell] = {"group": cell[0], "permission": cell[1], "action": "add"}
+    request = factory.post("/", {"data": json.dumps(list(items.values()))})
+    request.user = get_user_model()(username="bench", is_staff=True, is_superuser=True)
+    response, results["post"] = measure(lambda: PermissionMatrixView.as_view()(request), memory)
+    results["post"]["status"] = response.status_code
+    results["post"]["changes"] = len(items)
+    # Undo the posted grants so repeated runs measure the same table
+    for group_id, permission_id in items:
+        through.objects.filter(group_id=group_id, permission_id=permission_id).delete()
+    return results
+
+
+def default_renderers():
+    try:
+        import jinja2  # noqa
+    except ImportError:
+        return ["python", "slim", "django"]
+    return ["python", "slim", "django", "jinja2"]
+
+
+def merge(runs):
+    """
+    Combine repeated runs of the phases, keeping the fastest time and the
+    largest memory peak of each phase
+    """
+    merged = {}
+    for name in runs[0]:
+        phase = dict(runs[0][name])
+        phase["seconds"] = min(run[name]["seconds"] for run in runs)
+        if "rows_per_second" in phase:
+            phase["rows_per_second"] = max(run[name]["rows_per_second"] for run in runs)
+        peaks = [run[name]["peak_bytes"] for run in runs if run[name]["peak_bytes"] is not None]
+        phase["peak_bytes"] = max(peaks) if peaks else None
+        merged[name] = phase
+    return merged
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", action="append", metavar="APPSxMODELSxPERMS:GROUPS",
+                        help="Size of a synthetic table, may be repeated (default 10x50x4:100)")
+    parser.add_argument("--density", type=float, default=0.1, help="Fraction of cells granted")
+    parser.add_argument("--changes", type=int, default=1000, help="Number of changes in the POST phase")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs per size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--renderer", action="append", metavar="NAME",
+                        help="Row renderer to measure, may be repeated (default python, slim, django and jinja2 if installed)")
+    parser.add_argument("--no-memory", action="store_true", help="Do not measure peak memory")
+    parser.add_argument("--output", help="File to write JSON results to (default stdout)")
+    args = parser.parse_args(argv)
+
+    call_command("migrate", verbosity=0)
+    memory = tracemalloc is not None and not args.no_memory
+    renderers = args.renderer or default_renderers()
+    rng = random.Random(args.seed)
+    results = []
+    for spec in args.size or ["10x50x4:100"]:
+        size = Size(spec, args.density)
+        populate(size, rng)
+        # Time without tracing, which slows allocation heavy code, then trace
+        runs = [run_phases(size, args.changes, rng, False, renderers) for i in range(args.repeat)]
+        if memory:
+            runs.append(run_phases(size, args.changes, rng, True, renderers))
+        results.append({"size": size.as_dict(), "phases": merge(runs)})
+
+    output = json.dumps({
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "results": results,
+    }, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
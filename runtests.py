@@ -9,7 +9,12 @@ try:
         DATABASES={
             "default": {
                 "ENGINE": "django.db.backends.sqlite3",
-            }
+            },
+            # Stands in for a read replica of the default database
+            "replica": {
+                "ENGINE": "django.db.backends.sqlite3",
+                "TEST": {"MIRROR": "default"},
+            },
         },
         ROOT_URLCONF="permatrix.urls",
         INSTALLED_APPS=[
@@ -19,6 +24,14 @@ try:
             "permatrix",
         ],
         SITE_ID=1,
+        STATIC_URL="/static/",
+        TEMPLATES=[
+            {
+                "BACKEND": "django.template.backends.django.DjangoTemplates",
+                "DIRS": ["tests/templates"],
+                "APP_DIRS": True,
+            }
+        ],
         NOSE_ARGS=['-s'],
         MIDDLEWARE_CLASSES=(),
     )
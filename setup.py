@@ -33,10 +33,17 @@ setup(
     url='https://github.com/nebulans/django-permatrix',
     packages=[
         'permatrix',
+        'permatrix.management',
+        'permatrix.management.commands',
+        'permatrix.migrations',
     ],
     include_package_data=True,
     install_requires=[
     ],
+    extras_require={
+        'jinja2': ['Jinja2'],
+        'xlsx': ['XlsxWriter'],
+    },
     license="BSD",
     zip_safe=False,
     keywords='django-permatrix',
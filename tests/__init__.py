@@ -0,0 +1,21 @@
+from django.contrib.auth import get_user_model
+from django.test import AsyncRequestFactory, RequestFactory
+
+
+class StaffRequestMixin(object):
+    """
+    Make the requests of a request factory come from an active staff superuser
+    """
+
+    def request(self, **request):
+        request = super(StaffRequestMixin, self).request(**request)
+        request.user = get_user_model()(username="staff", is_staff=True, is_superuser=True)
+        return request
+
+
+class StaffRequestFactory(StaffRequestMixin, RequestFactory):
+    pass
+
+
+class StaffAsyncRequestFactory(StaffRequestMixin, AsyncRequestFactory):
+    pass
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser, Permission
+from django.core.cache import cache as django_cache
+from django.core.exceptions import PermissionDenied
+from django.test import AsyncRequestFactory, TestCase
+
+from model_mommy import mommy
+
+from permatrix.async_views import AsyncPermissionMatrixView
+from permatrix.views import PermissionMatrixView
+
+from tests import StaffRequestFactory, StaffAsyncRequestFactory
+
+
+class TestAsyncView(TestCase):
+    """
+    Test the async matrix view against the streaming sync view
+    """
+
+    def setUp(self):
+        django_cache.clear()
+        permissions = Permission.objects.all()[:3]
+        for i in range(5):
+            group = mommy.make("auth.Group", name="group-{}".format(4 - i))
+            group.permissions.add(*permissions[:i % 3])
+
+    async def get(self, view, **params):
+        response = await view(StaffAsyncRequestFactory().get("/", params))
+        return response, [part async for part in response.streaming_content]
+
+    async def test_same_page(self):
+        """
+        Test that the async view streams the same page as the sync view
+        """
+        expected = await sync_to_async(self.sync_page)(limit=3, offset=1)
+        response, parts = await self.get(AsyncPermissionMatrixView.as_view(stream_chunk_size=2), limit=3, offset=1)
+        self.assertEqual(b"".join(parts), expected)
+        self.assertEqual(len(parts), 5)
+
+    def sync_page(self, **params):
+        view = PermissionMatrixView.as_view(streaming=True, instrument=False)
+        return b"".join(view(StaffRequestFactory().get("/", params)).streaming_content)
+
+    async def test_not_modified(self):
+        view = AsyncPermissionMatrixView.as_view()
+        response, parts = await self.get(view)
+        response = await view(StaffAsyncRequestFactory().get("/", headers={"If-None-Match": response["ETag"]}))
+        self.assertEqual(response.status_code, 304)
+
+    async def test_anonymous(self):
+        request = AsyncRequestFactory().get("/")
+        request.user = AnonymousUser()
+        with self.assertRaises(PermissionDenied):
+            await AsyncPermissionMatrixView.as_view()(request)
+
+    async def test_read_only(self):
+        response = await AsyncPermissionMatrixView.as_view()(StaffAsyncRequestFactory().post("/", {"data": "[]"}))
+        self.assertEqual(response.status_code, 405)
+
+    async def test_head(self):
+        response = await AsyncPermissionMatrixView.as_view()(StaffAsyncRequestFactory().head("/"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["ETag"])
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.contrib.auth.models import Group, Permission
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.test import TestCase
+
+from model_mommy import mommy
+
+from permatrix.bulk import PermissionChangeSet, PermissionSpec
+from permatrix.models import PermissionChange
+from permatrix.views import PermissionMatrixView
+
+from tests import StaffRequestFactory
+
+import io
+import json
+import os
+import shutil
+import tempfile
+
+
+class PermissionChangeSetTestCase(TestCase):
+
+    def setUp(self):
+        self.group = mommy.make("auth.Group")
+        self.other = mommy.make("auth.Group")
+        self.has_perm = mommy.make("auth.Permission")
+        self.group.permissions.add(self.has_perm)
+        self.not_perm = mommy.make("auth.Permission")
+
+    def item(self, group, permission, action):
+        return {"group": group.pk, "permission": permission.pk, "action": action}
+
+    def permission_ids(self, group):
+        return sorted(p.pk for p in group.permissions.all())
+
+    def test_apply(self):
+        """
+        Test adding and removing permissions in one batch
+        """
+        changes = PermissionChangeSet([
+            self.item(self.group, self.not_perm, "add"),
+            self.item(self.group, self.has_perm, "remove"),
+            self.item(self.other, self.has_perm, "add"),
+        ])
+        self.assertTrue(changes.is_valid())
+        changes.save()
+        self.assertEqual(self.permission_ids(self.group), [self.not_perm.pk])
+        self.assertEqual(self.permission_ids(self.other), [self.has_perm.pk])
+
+    def test_constant_queries(self):
+        """
+        Test that validating and saving uses the same number of queries for any batch size
+        """
+        permissions = [mommy.make("auth.Permission") for i in range(20)]
+        for batch in (permissions[:2], permissions[2:]):
+            changes = PermissionChangeSet([self.item(self.other, p, "add") for p in batch])
+            with self.assertNumQueries(3):
+                self.assertTrue(changes.is_valid())
+            # Savepoint, insert, journal insert and savepoint release
+            with self.assertNumQueries(4):
+                changes.save()
+        self.assertEqual(len(self.permission_ids(self.other)), 20)
+
+    def test_large_removal(self):
+        """
+        Test removing a permission from more groups than a single condition
+        or query could hold
+        """
+        Group.objects.bulk_create([Group(name="bulk-{}".format(i)) for i in range(1500)])
+        groups = list(Group.objects.filter(name__startswith="bulk-"))
+        self.has_perm.group_set.add(*groups)
+        changes = PermissionChangeSet([self.item(group, self.has_perm, "remove") for group in groups])
+        with self.assertNumQueries(5):
+            self.assertTrue(changes.is_valid())
+        changes.save()
+        self.assertEqual(list(self.has_perm.group_set.all()), [self.group])
+
+    def test_existing_limited_to_pairs(self):
+        """
+        Test that only the submitted pairs are read back as assigned
+        """
+        self.other.permissions.add(self.not_perm)
+        changes = PermissionChangeSet([
+            self.item(self.group, self.not_perm, "add"),
+            self.item(self.other, self.has_perm, "add"),
+        ])
+        self.assertTrue(changes.is_valid())
+        self.assertEqual(changes.existing, {})
+
+    def test_rollback(self):
+        """
+        Test that caches are not invalidated by a change set that rolls back
+        """
+        changes = PermissionChangeSet([self.item(self.other, self.has_perm, "add")])
+        self.assertTrue(changes.is_valid())
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    changes.save()
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.permission_ids(self.other), [])
+
+    def test_membership_errors(self):
+        """
+        Test that adding a held permission or removing an unheld one is reported per item
+        """
+        changes = PermissionChangeSet([
+            self.item(self.group, self.has_perm, "add"),
+            self.item(self.group, self.not_perm, "remove"),
+            self.item(self.other, self.has_perm, "add"),
+        ])
+        self.assertFalse(changes.is_valid())
+        self.assertEqual(changes.errors, {0: ["Permission already assigned"], 1: ["Permission not assigned"]})
+
+    def test_missing_objects(self):
+        """
+        Test that unknown group and permission ids are reported
+        """
+        group_id, permission_id = self.other.pk, self.not_perm.pk
+        self.other.delete()
+        self.not_perm.delete()
+        changes = PermissionChangeSet([{"group": group_id, "permission": permission_id, "action": "add"}])
+        self.assertFalse(changes.is_valid())
+        self.assertEqual(changes.errors, {0: ["Group does not exist", "Permission does not exist"]})
+
+    def test_invalid_items(self):
+        """
+        Test that malformed items and actions are reported
+        """
+        changes = PermissionChangeSet([
+            {"group": "x", "permission": self.has_perm.pk, "action": "add"},
+            self.item(self.group, self.has_perm, "invalid"),
+        ])
+        self.assertFalse(changes.is_valid())
+        self.assertEqual(sorted(changes.errors), [0, 1])
+
+    def test_duplicate(self):
+        """
+        Test that the same cell cannot be changed twice in one batch
+        """
+        changes = PermissionChangeSet([self.item(self.group, self.not_perm, "add")] * 2)
+        self.assertFalse(changes.is_valid())
+        self.assertEqual(changes.errors, {1: ["Duplicate change"]})
+
+
+class BulkPostTestCase(TestCase):
+
+    def setUp(self):
+        self.factory = StaffRequestFactory()
+        self.group = mommy.make("auth.Group")
+        self.permission = mommy.make("auth.Permission")
+
+    def post(self, data):
+        request = self.factory.post("/", {"data": json.dumps(data)})
+        response = PermissionMatrixView.as_view()(request)
+        return response, json.loads(response.content.decode("utf-8"))
+
+    def test_post_applies(self):
+        """
+        Test that a valid post applies all changes
+        """
+        response, data = self.post([{"group": self.group.pk, "permission": self.permission.pk, "action": "add"}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data, {"added": 1, "removed": 0})
+        self.assertEqual(list(self.group.permissions.all()), [self.permission])
+
+    def test_post_errors(self):
+        """
+        Test that an invalid post applies nothing and returns per item errors
+        """
+        response, data = self.post([
+            {"group": self.group.pk, "permission": self.permission.pk, "action": "add"},
+            {"group": self.group.pk, "permission": self.permission.pk, "action": "remove"},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data["errors"], {"1": ["Duplicate change"]})
+        self.assertEqual(list(self.group.permissions.all()), [])
+
+
+class PermissionSpecTestCase(TestCase):
+
+    def setUp(self):
+        self.add, self.change, self.delete = [
+            Permission.objects.get(codename=codename) for codename in ("add_group", "change_group", "delete_group")]
+        self.group = mommy.make("auth.Group", name="Editors")
+        self.group.permissions.add(self.add, self.delete)
+        self.other = mommy.make("auth.Group", name="Others")
+        self.other.permissions.add(self.add)
+
+    def codenames(self, group):
+        return sorted(group.permissions.values_list("codename", flat=True))
+
+    def test_apply(self):
+        """
+        Test that listed groups end up with exactly their declared permissions
+        """
+        journaled = PermissionChange.objects.count()
+        spec = PermissionSpec({"Editors": {"auth.add_group", "auth.change_group"}})
+        self.assertTrue(spec.apply())
+        self.assertEqual(self.codenames(self.group), ["add_group", "change_group"])
+        self.assertEqual(self.codenames(self.other), ["add_group"])
+        self.assertEqual(spec.additions, [(self.group.pk, self.change.pk)])
+        self.assertEqual(spec.removals, [(self.group.pk, self.delete.pk)])
+        self.assertEqual(PermissionChange.objects.count(), journaled + 2)
+
+    def test_unchanged(self):
+        """
+        Test that reapplying a spec finds no changes in a few queries
+        """
+        spec = PermissionSpec({"Editors": {"auth.add_group", "auth.delete_group"}, "Others": {"auth.add_group"}})
+        with self.assertNumQueries(5):
+            self.assertTrue(spec.apply())
+        self.assertEqual(spec.changes, [])
+
+    def test_managed_columns(self):
+        """
+        Test that CSV specs only manage their own columns
+        """
+        spec = PermissionSpec.from_rows([["group", "auth.change_group"], ["Editors", "1"]])
+        spec.apply()
+        self.assertEqual(self.codenames(self.group), ["add_group", "change_group", "delete_group"])
+
+    def test_dry_run(self):
+        """
+        Test that a dry run works out the changes without making them
+        """
+        spec = PermissionSpec({"Editors": set(), "New": {"auth.add_group"}})
+        self.assertTrue(spec.apply(create_groups=True, dry_run=True))
+        self.assertEqual(len(spec.removals), 2)
+        self.assertEqual(len(spec.additions), 1)
+        self.assertEqual(spec.new_groups, ["New"])
+        self.assertFalse(Group.objects.filter(name="New").exists())
+        self.assertEqual(self.codenames(self.group), ["add_group", "delete_group"])
+
+    def test_create_groups(self):
+        spec = PermissionSpec({"New": {"auth.add_group"}})
+        self.assertFalse(spec.apply())
+        self.assertEqual(spec.errors, ["Unknown group New"])
+        self.assertTrue(spec.apply(create_groups=True))
+        self.assertEqual(self.codenames(Group.objects.get(name="New")), ["add_group"])
+
+    def test_unknown_permission(self):
+        spec = PermissionSpec({"Editors": {"auth.nope"}})
+        self.assertFalse(spec.apply())
+        self.assertEqual(spec.errors, ["Unknown permission auth.nope"])
+
+    def test_load(self):
+        """
+        Test reading the spec formats
+        """
+        spec = PermissionSpec.load(io.StringIO("group,auth.add_group,auth.change_group\nEditors,1,0\n"), "csv")
+        self.assertEqual(spec.grants, {"Editors": {"auth.add_group"}})
+        self.assertEqual(spec.managed, {"auth.add_group", "auth.change_group"})
+        spec = PermissionSpec.load(io.StringIO('{"Editors": ["auth.add_group"]}'), "json")
+        self.assertEqual(spec.grants, {"Editors": {"auth.add_group"}})
+        self.assertIsNone(spec.managed)
+        with self.assertRaises(ValueError):
+            PermissionSpec.load(io.StringIO("group,auth.add_group\nEditors,maybe\n"), "csv")
+        with self.assertRaises(ValueError):
+            PermissionSpec.load(io.StringIO('["auth.add_group"]'), "json")
+
+
+class ApplyCommandTestCase(TestCase):
+
+    def setUp(self):
+        self.group = mommy.make("auth.Group", name="Editors")
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with io.open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        return path
+
+    def test_apply(self):
+        path = self.write("spec.json", '{"Editors": ["auth.add_group"]}')
+        out = io.StringIO()
+        call_command("permatrix_apply", path, stdout=out)
+        self.assertIn("1 additions, 0 removals", out.getvalue())
+        self.assertEqual(list(self.group.permissions.values_list("codename", flat=True)), ["add_group"])
+
+    def test_dry_run(self):
+        path = self.write("spec.csv", "group,auth.add_group\nEditors,1\n")
+        out = io.StringIO()
+        call_command("permatrix_apply", path, dry_run=True, stdout=out)
+        self.assertIn("+ Editors auth.add_group", out.getvalue())
+        self.assertFalse(self.group.permissions.exists())
+
+    def test_yaml(self):
+        try:
+            import yaml  # noqa
+        except ImportError:
+            self.skipTest("PyYAML is not installed")
+        path = self.write("spec.yml", "Editors:\n  - auth.add_group\n")
+        call_command("permatrix_apply", path, stdout=io.StringIO())
+        self.assertTrue(self.group.permissions.exists())
+
+    def test_errors(self):
+        with self.assertRaises(CommandError):
+            call_command("permatrix_apply", self.write("spec.txt", ""))
+        with self.assertRaises(CommandError):
+            call_command("permatrix_apply", self.write("spec.json", '{"Missing": []}'))
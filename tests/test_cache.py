@@ -0,0 +1,374 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.apps import apps
+from django.contrib.auth.models import Permission
+from django.core.cache import cache as django_cache
+from django.db import transaction
+from django.db.models.signals import post_migrate
+from django.test import TestCase
+
+from mock import patch
+from model_mommy import mommy
+
+from permatrix import cache
+from permatrix.bulk import PermissionChangeSet
+from permatrix.views import GroupPermissionForm, PermissionMatrixView, PermissionRow
+
+
+class VersionTestCase(TestCase):
+
+    def setUp(self):
+        django_cache.clear()
+
+    def test_get_version_stable(self):
+        """
+        Test that reading a version counter does not change it
+        """
+        self.assertEqual(cache.get_version("test"), cache.get_version("test"))
+
+    def test_bump_version(self):
+        """
+        Test that bumping a version counter increments it
+        """
+        version = cache.get_version("test")
+        self.assertEqual(cache.bump_version("test"), version + 1)
+        self.assertEqual(cache.get_version("test"), version + 1)
+
+    def test_bump_missing_version(self):
+        """
+        Test that bumping a counter that is not in the cache initialises it
+        """
+        self.assertTrue(cache.bump_version("missing") is not None)
+
+
+class HeaderCacheTestCase(TestCase):
+
+    def setUp(self):
+        django_cache.clear()
+
+    def get_columns(self):
+        return PermissionMatrixView().get_columns()
+
+    def test_steady_state_no_queries(self):
+        """
+        Test that a cached column index is used without querying permissions
+        """
+        columns = self.get_columns()
+        with self.assertNumQueries(0):
+            cached = self.get_columns()
+        self.assertEqual(cached.pks, columns.pks)
+        self.assertEqual([m["cell"].attr("colspan") for m in cached.modules],
+                         [m["cell"].attr("colspan") for m in columns.modules])
+
+    def test_permission_save_invalidates(self):
+        """
+        Test that creating a permission rebuilds the header tree
+        """
+        columns = self.get_columns()
+        permission = mommy.make("auth.Permission")
+        self.assertEqual(len(self.get_columns()), len(columns) + 1)
+        self.assertTrue(permission.pk in self.get_columns().positions)
+
+    def test_permission_delete_invalidates(self):
+        """
+        Test that deleting a permission rebuilds the header tree
+        """
+        columns = self.get_columns()
+        Permission.objects.get(pk=columns.pks[0]).delete()
+        self.assertEqual(len(self.get_columns()), len(columns) - 1)
+
+    def test_content_type_save_invalidates(self):
+        """
+        Test that changing a content type bumps the headers version
+        """
+        version = cache.get_version(cache.HEADERS)
+        mommy.make("contenttypes.ContentType")
+        self.assertNotEqual(cache.get_version(cache.HEADERS), version)
+
+    def test_migrate_invalidates(self):
+        """
+        Test that the post_migrate signal bumps the headers version
+        """
+        version = cache.get_version(cache.HEADERS)
+        app_config = apps.get_app_config("permatrix")
+        post_migrate.send(sender=app_config, app_config=app_config, verbosity=0, interactive=False,
+                          using="default", apps=apps, plan=[])
+        self.assertNotEqual(cache.get_version(cache.HEADERS), version)
+
+
+class RowCacheTestCase(TestCase):
+
+    def setUp(self):
+        django_cache.clear()
+        self.group = mommy.make("auth.Group")
+        self.other = mommy.make("auth.Group")
+        self.permission = Permission.objects.all()[0]
+
+    def render(self):
+        PMV = PermissionMatrixView()
+        PMV.get_columns()
+        PMV.attach_groups()
+        return {row.group.pk: row.html for row in PMV.group_rows}
+
+    def test_rows_cached(self):
+        """
+        Test that rows are served from the cache on the second render
+        """
+        first = self.render()
+        self.assertEqual(cache.row_cache_stats(), {"hits": 0, "misses": 2})
+        with patch.object(PermissionRow, "render") as render:
+            second = self.render()
+        self.assertFalse(render.called)
+        self.assertEqual(first, second)
+        self.assertEqual(cache.row_cache_stats(), {"hits": 2, "misses": 2})
+
+    def test_m2m_invalidates_group(self):
+        """
+        Test that changing a group's permissions only re-renders that group
+        """
+        self.render()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.permissions.add(self.permission)
+        rows = self.render()
+        self.assertEqual(cache.row_cache_stats(), {"hits": 1, "misses": 3})
+        self.assertIn("perm_yes", rows[self.group.pk])
+
+    def test_invalidated_on_commit(self):
+        """
+        Test that rows are only invalidated once the change is committed, so
+        requests during the transaction cannot cache old rows as new ones
+        """
+        self.render()
+        keys = cache.row_keys([self.group.pk])
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.group.permissions.add(self.permission)
+        self.assertEqual(cache.row_keys([self.group.pk]), keys)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(cache.row_keys([self.group.pk]), keys)
+        self.assertIn("perm_yes", self.render()[self.group.pk])
+
+    def commit_after(self, view, name):
+        """
+        Make a view commit a grant just after calling one of its methods, as
+        another process would between reading memberships and caching rows
+        """
+        method = getattr(view, name)
+
+        def read_then_commit(*args, **kwargs):
+            result = method(*args, **kwargs)
+            if name == "iter_memberships":
+                result = iter(list(result))
+            with self.captureOnCommitCallbacks(execute=True):
+                self.group.permissions.add(self.permission)
+            return result
+        setattr(view, name, read_then_commit)
+
+    def test_commit_during_render(self):
+        """
+        Test that rows rendered from memberships read before a change are not
+        served once the change is committed
+        """
+        for name, kwargs in (("get_memberships", {}), ("iter_memberships", {"streaming": True}),
+                             ("get_snapshot", {"snapshot": True})):
+            django_cache.clear()
+            cache._local.clear()
+            self.group.permissions.clear()
+            PMV = PermissionMatrixView(**kwargs)
+            PMV.get_columns()
+            self.commit_after(PMV, name)
+            if PMV.streaming:
+                html = "".join(PMV.iter_rows())
+            else:
+                PMV.attach_groups()
+                html = "".join(row.html for row in PMV.group_rows)
+            self.assertFalse("perm_yes" in html, name)
+            self.assertTrue("perm_yes" in self.render()[self.group.pk], name)
+
+    def test_rollback_not_invalidated(self):
+        """
+        Test that a rolled back change leaves the cache alone
+        """
+        self.render()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    self.group.permissions.add(self.permission)
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(cache.row_cache_stats(), {"hits": 0, "misses": 2})
+
+    def test_reverse_m2m_invalidates_groups(self):
+        """
+        Test that adding groups from the permission side invalidates those groups
+        """
+        self.render()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.permission.group_set.add(self.other)
+        rows = self.render()
+        self.assertEqual(cache.row_cache_stats(), {"hits": 1, "misses": 3})
+        self.assertIn("perm_yes", rows[self.other.pk])
+
+    def test_reverse_clear_invalidates_groups(self):
+        """
+        Test that clearing a permission from all groups invalidates the groups that held it
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.permissions.add(self.permission)
+        self.render()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.permission.group_set.clear()
+        rows = self.render()
+        self.assertEqual(cache.row_cache_stats(), {"hits": 1, "misses": 3})
+        self.assertNotIn("perm_yes", rows[self.group.pk])
+
+    def test_form_save_invalidates(self):
+        """
+        Test that saving a permission form invalidates the group's row
+        """
+        self.render()
+        with patch.object(cache, "invalidate_row") as invalidate_row:
+            form = GroupPermissionForm({"group": self.group.pk, "permission": self.permission.pk, "action": "add"})
+            form.is_valid()
+            with self.captureOnCommitCallbacks(execute=True):
+                form.save()
+        invalidate_row.assert_called_with(self.group.pk)
+
+    def test_bulk_save_invalidates(self):
+        """
+        Test that applying a change set re-renders the changed groups
+        """
+        self.render()
+        changes = PermissionChangeSet([{"group": self.group.pk, "permission": self.permission.pk, "action": "add"}])
+        changes.is_valid()
+        with self.captureOnCommitCallbacks(execute=True):
+            changes.save()
+        rows = self.render()
+        self.assertEqual(cache.row_cache_stats(), {"hits": 1, "misses": 3})
+        self.assertIn("perm_yes", rows[self.group.pk])
+
+    def test_group_rename_invalidates(self):
+        """
+        Test that renaming a group re-renders its row
+        """
+        self.render()
+        self.group.name = "Renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.save()
+        self.assertIn("Renamed", self.render()[self.group.pk])
+
+
+class SnapshotCacheTestCase(TestCase):
+
+    def setUp(self):
+        django_cache.clear()
+        cache._local.clear()
+        self.group = mommy.make("auth.Group", name="alpha")
+        self.other = mommy.make("auth.Group", name="beta")
+        self.permission = Permission.objects.all()[0]
+        self.group.permissions.add(self.permission)
+
+    def render(self, snapshot=True, **kwargs):
+        PMV = PermissionMatrixView(snapshot=snapshot, **kwargs)
+        PMV.get_columns()
+        PMV.attach_groups()
+        return {row.group.pk: row.html for row in PMV.group_rows}
+
+    def test_matches_queried_rows(self):
+        """
+        Test that rows read from the snapshot match rows read from the database
+        """
+        rows = self.render()
+        django_cache.clear()
+        self.assertEqual(rows, self.render(snapshot=False))
+        self.assertIn("perm_yes", rows[self.group.pk])
+
+    def test_no_queries(self):
+        """
+        Test that a cached snapshot is read without any queries, from process
+        memory or from the shared cache
+        """
+        self.render()
+        with self.assertNumQueries(0):
+            self.render()
+        cache._local.clear()
+        with self.assertNumQueries(0):
+            self.render()
+
+    def test_changes_patch_snapshot(self):
+        """
+        Test that permission changes patch the shared snapshot instead of
+        leaving it to be rebuilt from the database
+        """
+        self.render()
+        superseded = cache._snapshot_key(cache.get_version(cache.MATRIX))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.permissions.add(self.permission)
+        self.assertIsNone(django_cache.get(superseded))
+        changes = PermissionChangeSet([{"group": self.group.pk, "permission": self.permission.pk, "action": "remove"}])
+        changes.is_valid()
+        with self.captureOnCommitCallbacks(execute=True):
+            changes.save()
+        with self.assertNumQueries(0):
+            rows = self.render()
+        self.assertNotIn("perm_yes", rows[self.group.pk])
+        self.assertIn("perm_yes", rows[self.other.pk])
+
+    def test_out_of_order_commits(self):
+        """
+        Test that a change whose commit callback runs after a later change's
+        is not patched over it, and the snapshot is rebuilt instead
+        """
+        self.render()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.other.permissions.add(self.permission)
+            self.other.permissions.remove(self.permission)
+        for callback in reversed(callbacks):
+            callback()
+        self.assertNotIn("perm_yes", self.render()[self.other.pk])
+
+    def test_filtered_build(self):
+        """
+        Test that a snapshot built for a request of some apps holds the grants
+        of every app
+        """
+        site = Permission.objects.get(codename="add_site")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.permissions.add(site)
+        self.render(app_labels=["auth"])
+        with self.assertNumQueries(0):
+            rows = self.render()
+        self.assertIn("data-permission_id='{}' data-permission_name='sites.add_site' data-module='sites' "
+                      "class='permission-cell perm_yes'".format(site.pk), rows[self.other.pk])
+
+    def test_rollback(self):
+        """
+        Test that a rolled back change is never patched into the snapshot
+        """
+        self.render()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    self.other.permissions.add(self.permission)
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(callbacks, [])
+        cache._local.clear()
+        self.assertNotIn("perm_yes", self.render()[self.other.pk])
+
+    def test_group_change_rebuilds(self):
+        """
+        Test that adding a group rebuilds the snapshot
+        """
+        self.render()
+        with self.captureOnCommitCallbacks(execute=True):
+            group = mommy.make("auth.Group", name="gamma")
+        self.assertIn(group.pk, self.render())
+
+    def test_window(self):
+        rows = self.render(group_prefix="b")
+        self.assertEqual(list(rows), [self.other.pk])
@@ -3,7 +3,9 @@
 
 from django.test import TestCase
 
-from permatrix.views import Cell, PermissionCell, PermNameCell
+from model_mommy import mommy
+
+from permatrix.views import Cell, PermissionCell, PermNameCell, RowRenderer
 
 class CellTestCase(TestCase):
 
@@ -131,6 +133,21 @@ class CellTestCase(TestCase):
         c = Cell("Title")
         self.assertEqual(c.html, "<td >Title</td>")
 
+    def test_render_attrs_escaped(self):
+        """
+        Test that attribute values cannot break out of their quotes
+        """
+        c = Cell()
+        c.attr(key="it's <b>")
+        self.assertEqual(c.render_attrs(), "key='it&#x27;s &lt;b&gt;'")
+
+    def test_html_output_text_escaped(self):
+        """
+        Test that cell text is escaped in the HTML output
+        """
+        c = Cell("<b>")
+        self.assertEqual(c.html, "<td >&lt;b&gt;</td>")
+
     def test_html_output_attrs(self):
         """
         Test that the HTML output contains the attrs as rendered
@@ -199,4 +216,43 @@ class PermNameCellTestCase(TestCase):
         Test cell html output
         """
         c = PermNameCell("TEXT")
-        self.assertEqual(c.html, "<td class='permname'><span class='vertical-text'>TEXT</span></td>")
\ No newline at end of file
+        self.assertEqual(c.html, "<td class='permname'><span class='vertical-text'>TEXT</span></td>")
+
+
+class RowRendererTestCase(TestCase):
+
+    def setUp(self):
+        content_type = mommy.make("contenttypes.ContentType", app_label="app")
+        self.permissions = [
+            {"permission": mommy.make("auth.Permission", content_type=content_type), "name": name}
+            for name in ("app.one", "app.it's")
+        ]
+        self.renderer = RowRenderer(self.permissions)
+        self.group = mommy.make("auth.Group", name="<group>")
+
+    def test_render(self):
+        """
+        Test that rows match the output of the equivalent permission cells
+        """
+        html = self.renderer.render(self.group, [True, False])
+        expected = []
+        for permission, has_perm in zip(self.permissions, [True, False]):
+            cell = PermissionCell("", has_perm)
+            cell.data(group_id=self.group.pk, group_name=self.group.name)
+            cell.data(permission_id=permission["permission"].pk, permission_name=permission["name"], module="app")
+            expected.append(cell.html)
+        self.assertEqual(html, "<tr><td>&lt;group&gt;</td>{}</tr>".format("".join(expected)))
+
+    def test_render_escaped(self):
+        """
+        Test that names are escaped in the rendered row
+        """
+        html = self.renderer.render(self.group, [False, False])
+        self.assertIn("data-group_name='&lt;group&gt;'", html)
+        self.assertIn("data-permission_name='app.it&#x27;s'", html)
+
+    def test_render_no_columns(self):
+        """
+        Test rendering a row with no permission columns
+        """
+        self.assertEqual(RowRenderer([]).render(self.group, []), "<tr><td>&lt;group&gt;</td></tr>")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from unittest import skipIf
+
+from django.contrib.auth.models import Permission
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from mock import patch
+from model_mommy import mommy
+
+from permatrix import export
+from permatrix.views import PermissionMatrixExportView, PermissionMatrixView
+
+from tests import StaffRequestFactory
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+import csv
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+
+
+class ExportTestCase(TestCase):
+
+    def setUp(self):
+        self.permission = Permission.objects.get(codename="add_group")
+        self.group = mommy.make("auth.Group", name="Editors")
+        self.group.permissions.add(self.permission)
+        mommy.make("auth.Group", name="Admins")
+        self.factory = StaffRequestFactory()
+
+    def parse(self, text):
+        return list(csv.reader(io.StringIO(text)))
+
+    def test_rows(self):
+        """
+        Test that columns follow all_permissions and rows the group order
+        """
+        view = PermissionMatrixView()
+        rows = list(export.iter_rows(view))
+        view.build_headers(view.get_permissions())
+        self.assertEqual(rows[0][1:], [node["name"] for node in view.all_permissions()])
+        self.assertEqual([row[0] for row in rows[1:]], ["Admins", "Editors"])
+        column = rows[0].index("auth.add_group")
+        self.assertEqual([row[column] for row in rows[1:]], [0, 1])
+        self.assertEqual(sum(rows[2][1:]), 1)
+
+    def test_csv_view(self):
+        """
+        Test streaming a CSV export of some apps
+        """
+        response = PermissionMatrixExportView.as_view()(self.factory.get("/", {"apps": "auth"}))
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn("permatrix.csv", response["Content-Disposition"])
+        rows = self.parse(b"".join(response.streaming_content).decode("utf-8"))
+        self.assertTrue(all(name.startswith("auth.") for name in rows[0][1:]))
+        self.assertEqual(rows[2][rows[0].index("auth.add_group")], "1")
+
+    def test_csv_view_complete(self):
+        """
+        Test that the page size and default apps of the matrix page do not
+        truncate exports, while explicit filters still apply
+        """
+        with patch.object(PermissionMatrixView, "paginate_by", 1), \
+                patch.object(PermissionMatrixView, "default_apps", ["sites"]):
+            response = PermissionMatrixExportView.as_view()(self.factory.get("/"))
+            rows = self.parse(b"".join(response.streaming_content).decode("utf-8"))
+            self.assertEqual([row[0] for row in rows[1:]], ["Admins", "Editors"])
+            self.assertIn("auth.add_group", rows[0])
+            response = PermissionMatrixExportView.as_view()(self.factory.get("/", {"limit": 1, "apps": "sites"}))
+            rows = self.parse(b"".join(response.streaming_content).decode("utf-8"))
+            self.assertEqual([row[0] for row in rows[1:]], ["Admins"])
+            self.assertIn("sites.add_site", rows[0])
+            self.assertTrue(all(name.startswith("sites.") for name in rows[0][1:]))
+
+    def test_unknown_format(self):
+        response = PermissionMatrixExportView.as_view()(self.factory.get("/", {"format": "pdf"}))
+        self.assertEqual(response.status_code, 400)
+
+    @skipIf(xlsxwriter is None, "XlsxWriter is not installed")
+    def test_xlsx_view(self):
+        """
+        Test downloading an XLSX export
+        """
+        response = PermissionMatrixExportView.as_view()(self.factory.get("/", {"format": "xlsx"}))
+        content = b"".join(response.streaming_content)
+        sheet = zipfile.ZipFile(io.BytesIO(content)).read("xl/worksheets/sheet1.xml").decode("utf-8")
+        self.assertIn("Editors", sheet)
+        self.assertIn("auth.add_group", sheet)
+
+    @skipIf(xlsxwriter is None, "XlsxWriter is not installed")
+    def test_xlsx_formula_name(self):
+        """
+        Test a group name starting with "=" is written as a string, not a formula
+        """
+        mommy.make("auth.Group", name="=HYPERLINK(A1)")
+        response = PermissionMatrixExportView.as_view()(self.factory.get("/", {"format": "xlsx"}))
+        content = b"".join(response.streaming_content)
+        sheet = zipfile.ZipFile(io.BytesIO(content)).read("xl/worksheets/sheet1.xml").decode("utf-8")
+        self.assertIn("=HYPERLINK(A1)", sheet)
+        self.assertNotIn("<f>", sheet)
+
+    def test_command_csv(self):
+        """
+        Test exporting CSV to standard output
+        """
+        out = io.StringIO()
+        call_command("permatrix_export", apps="auth", group="Ed", stdout=out)
+        rows = self.parse(out.getvalue())
+        self.assertEqual([row[0] for row in rows], ["group", "Editors"])
+        self.assertEqual(rows[1][rows[0].index("auth.add_group")], "1")
+
+    def test_command_file(self):
+        """
+        Test exporting to files, choosing the format from the extension
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "matrix.csv")
+        call_command("permatrix_export", output=path)
+        with io.open(path, newline="") as f:
+            self.assertEqual(len(list(csv.reader(f))), 3)
+        if xlsxwriter is not None:
+            path = os.path.join(directory, "matrix.xlsx")
+            call_command("permatrix_export", output=path)
+            self.assertTrue(zipfile.is_zipfile(path))
+
+    def test_command_xlsx_needs_file(self):
+        with self.assertRaises(CommandError):
+            call_command("permatrix_export", format="xlsx")
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.cache import cache as django_cache
+from django.test import TestCase
+
+from model_mommy import mommy
+
+from permatrix import cache, index
+from permatrix.index import ALL, PermissionIndex
+
+
+class PermissionIndexTestCase(TestCase):
+
+    def setUp(self):
+        self.index = PermissionIndex(
+            [(1, "app", "one"), (2, "app", "two"), (3, "other", "three")],
+            [(10, "Alpha"), (20, "Beta"), (30, "Gamma")],
+            [(10, 1), (10, 2), (20, 1), (30, 3)],
+        )
+
+    def test_resolve(self):
+        """
+        Test resolving permission names to ids
+        """
+        self.assertEqual(self.index.resolve(["app.two", "other.three", "app.nope"]), ([2, 3], ["app.nope"]))
+
+    def test_any(self):
+        """
+        Test finding groups holding any of some permissions
+        """
+        self.assertEqual(self.index.group_ids([1]), {10, 20})
+        self.assertEqual(self.index.group_ids([2, 3]), {10, 30})
+
+    def test_all(self):
+        """
+        Test finding groups holding all of some permissions
+        """
+        self.assertEqual(self.index.group_ids([1, 2], ALL), {10})
+        self.assertEqual(self.index.group_ids([1, 3], ALL), set())
+
+    def test_no_permissions(self):
+        """
+        Test that no permissions match no groups
+        """
+        self.assertEqual(self.index.group_ids([]), set())
+        self.assertEqual(self.index.group_ids([], ALL), set())
+
+    def test_named_groups(self):
+        """
+        Test listing groups ordered by name
+        """
+        self.assertEqual(self.index.named_groups({30, 10}), [{"id": 10, "name": "Alpha"}, {"id": 30, "name": "Gamma"}])
+
+
+class HoldersTestCase(TestCase):
+
+    def setUp(self):
+        django_cache.clear()
+        cache._local.clear()
+        User = get_user_model()
+        self.add, self.change = [
+            Permission.objects.get(codename=codename) for codename in ("add_group", "change_group")
+        ]
+        self.group = mommy.make("auth.Group", name="Editors")
+        self.group.permissions.add(self.add, self.change)
+        self.other = mommy.make("auth.Group", name="Adders")
+        self.other.permissions.add(self.add)
+        self.member = User.objects.create_user("member")
+        self.member.groups.add(self.other)
+        self.member.user_permissions.add(self.change)
+        self.direct = User.objects.create_user("direct")
+        self.direct.user_permissions.add(self.change)
+        self.inactive = User.objects.create_user("inactive", is_active=False)
+        self.inactive.groups.add(self.group)
+        self.superuser = User.objects.create_superuser("root", "root@example.com", "password")
+
+    def usernames(self, result):
+        return [user["username"] for user in result["users"]]
+
+    def test_groups(self):
+        """
+        Test finding groups from the index
+        """
+        result = index.holders(["auth.add_group"])
+        self.assertEqual([group["name"] for group in result["groups"]], ["Adders", "Editors"])
+        self.assertNotIn("users", result)
+        result = index.holders(["auth.add_group", "auth.change_group"], ALL)
+        self.assertEqual([group["name"] for group in result["groups"]], ["Editors"])
+
+    def test_cached(self):
+        """
+        Test that repeated group lookups do not query the database
+        """
+        index.holders(["auth.add_group"])
+        with self.assertNumQueries(0):
+            index.holders(["auth.change_group"])
+
+    def test_invalidated(self):
+        """
+        Test that changing group permissions updates the index
+        """
+        index.holders(["auth.add_group"])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.permissions.remove(self.add)
+        self.assertEqual([group["name"] for group in index.holders(["auth.add_group"])["groups"]], ["Adders"])
+
+    def test_users_any(self):
+        """
+        Test finding users holding any of some permissions
+        """
+        result = index.holders(["auth.add_group"], users=True)
+        self.assertEqual(self.usernames(result), ["member", "root"])
+        result = index.holders(["auth.add_group", "auth.change_group"], users=True)
+        self.assertEqual(self.usernames(result), ["direct", "member", "root"])
+
+    def test_users_all(self):
+        """
+        Test that users can hold all of some permissions through different
+        groups and direct grants
+        """
+        result = index.holders(["auth.add_group", "auth.change_group"], ALL, users=True)
+        self.assertEqual(self.usernames(result), ["member", "root"])
+
+    def test_unknown(self):
+        """
+        Test that unknown permissions raise KeyError
+        """
+        with self.assertRaises(KeyError):
+            index.holders(["auth.nope"])
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.test import TestCase
+
+from permatrix.instrumentation import PhaseTimer, phase_finished
+from permatrix.views import PermissionMatrixView
+
+from tests import StaffRequestFactory
+
+
+class PhaseTimerTestCase(TestCase):
+
+    def test_records_phase(self):
+        """
+        Test that a phase records its duration and query count
+        """
+        timer = PhaseTimer(None)
+        with timer.phase("query"):
+            list(Group.objects.all())
+            list(Group.objects.all())
+        name, duration, queries = timer.phases[0]
+        self.assertEqual(name, "query")
+        self.assertTrue(duration >= 0)
+        self.assertEqual(queries, 2)
+
+    def test_signal(self):
+        """
+        Test that finished phases are published through the signal
+        """
+        received = []
+
+        def receiver(sender, **kwargs):
+            received.append((sender, kwargs["phase"], kwargs["queries"]))
+        phase_finished.connect(receiver)
+        try:
+            with PhaseTimer("sender").phase("empty"):
+                pass
+        finally:
+            phase_finished.disconnect(receiver)
+        self.assertEqual(received, [("sender", "empty", 0)])
+
+    def test_server_timing(self):
+        """
+        Test formatting of the Server-Timing header value
+        """
+        timer = PhaseTimer(None)
+        timer.phases = [("one", 0.0015, 2), ("two", 0.25, 0)]
+        self.assertEqual(timer.server_timing(), 'one;dur=1.50;desc="2 queries", two;dur=250.00;desc="0 queries"')
+
+
+class ViewInstrumentationTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.factory = StaffRequestFactory()
+
+    def test_server_timing_header(self):
+        """
+        Test that the matrix view reports its phases in a Server-Timing header
+        """
+        response = PermissionMatrixView.as_view()(self.factory.get("/"))
+        phases = [part.split(";")[0] for part in response["Server-Timing"].split(", ")]
+        self.assertEqual(phases, ["get_permissions", "build_headers", "calculate_colspan", "build_columns",
+                                  "get_memberships", "attach_groups", "render_rows", "render"])
+        self.assertIn('get_memberships;dur=', response["Server-Timing"])
+
+    def test_disabled(self):
+        """
+        Test that no header is sent with instrumentation switched off
+        """
+        response = PermissionMatrixView.as_view(instrument=False)(self.factory.get("/"))
+        self.assertFalse(response.has_header("Server-Timing"))
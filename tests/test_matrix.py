@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.contrib.auth.models import Permission
+from django.test import TestCase
+
+from permatrix.matrix import ColumnIndex, MembershipSnapshot, PermissionMatrix
+
+
+class PermissionMatrixTestCase(TestCase):
+
+    def setUp(self):
+        self.matrix = PermissionMatrix([5, 3, 11, 7, 2, 13, 17, 19, 23])
+        self.matrix.add_row(1, [3, 23])
+        self.matrix.add_row(2)
+
+    def test_positions(self):
+        """
+        Test that column positions follow the column order
+        """
+        self.assertEqual(self.matrix.positions[5], 0)
+        self.assertEqual(self.matrix.positions[23], 8)
+
+    def test_row_storage(self):
+        """
+        Test that rows are stored as one bit per column
+        """
+        self.assertEqual(len(self.matrix.rows[1]), 2)
+
+    def test_has_perm(self):
+        """
+        Test lookup of individual cells
+        """
+        self.assertTrue(self.matrix.has_perm(1, 3))
+        self.assertTrue(self.matrix.has_perm(1, 23))
+        self.assertFalse(self.matrix.has_perm(1, 5))
+        self.assertFalse(self.matrix.has_perm(2, 3))
+
+    def test_has_perm_unknown(self):
+        """
+        Test that unknown groups and permissions are reported as not held
+        """
+        self.assertFalse(self.matrix.has_perm(99, 3))
+        self.assertFalse(self.matrix.has_perm(1, 99))
+
+    def test_unknown_permission_ignored(self):
+        """
+        Test that permissions outside the columns are ignored when adding a row
+        """
+        self.matrix.add_row(3, [99, 5])
+        self.assertEqual(list(self.matrix.permission_ids(3)), [5])
+
+    def test_row(self):
+        """
+        Test iteration over a row in column order
+        """
+        expected = [False, True, False, False, False, False, False, False, True]
+        self.assertEqual(list(self.matrix.row(1)), expected)
+
+    def test_grant_revoke(self):
+        """
+        Test setting and clearing individual cells
+        """
+        self.matrix.grant(2, 19)
+        self.assertEqual(list(self.matrix.permission_ids(2)), [19])
+        self.matrix.revoke(1, 3)
+        self.assertEqual(list(self.matrix.permission_ids(1)), [23])
+
+    def test_group_order(self):
+        """
+        Test that groups iterate in the order they were added
+        """
+        self.matrix.add_row(0)
+        self.assertEqual(list(self.matrix), [1, 2, 0])
+
+    def test_full_row(self):
+        """
+        Test that a full row sets every column and no bits past the last one
+        """
+        bits = self.matrix.add_full_row(3)
+        self.assertEqual(list(self.matrix.permission_ids(3)), self.matrix.columns)
+        self.assertEqual(bits, bytearray(b"\xff\x01"))
+
+    def test_union_row(self):
+        """
+        Test that a union row combines existing rows and extra permissions
+        """
+        self.matrix.add_row(3, [5, 19])
+        self.matrix.add_union_row(4, [self.matrix.rows[1], self.matrix.rows[3]], [11])
+        self.assertEqual(list(self.matrix.permission_ids(4)), [5, 3, 11, 19, 23])
+        self.matrix.add_union_row(5, [], [2])
+        self.assertEqual(list(self.matrix.permission_ids(5)), [2])
+
+    def test_bitmap_row(self):
+        """
+        Test that bitmap rows are copied as they are, or across different columns
+        """
+        self.matrix.add_bitmap_row(3, bytes(self.matrix.rows[1]))
+        self.assertEqual(list(self.matrix.permission_ids(3)), [3, 23])
+        other = PermissionMatrix([23, 1, 3, 5, 11])
+        runs = other.column_runs(self.matrix.columns)
+        self.assertEqual(runs, [[8, 0, 1], [1, 2, 1], [0, 3, 1], [2, 4, 1]])
+        other.add_bitmap_row(1, self.matrix.rows[1], runs)
+        self.assertEqual(list(other.permission_ids(1)), [23, 3])
+        self.assertEqual(len(other.rows[1]), 1)
+
+    def test_column_runs(self):
+        """
+        Test that consecutive columns are copied as one run
+        """
+        other = PermissionMatrix([3, 11, 7, 2, 19, 23])
+        self.assertEqual(other.column_runs(self.matrix.columns), [[1, 0, 4], [7, 4, 2]])
+        other.add_bitmap_row(1, self.matrix.rows[1], other.column_runs(self.matrix.columns))
+        self.assertEqual(list(other.permission_ids(1)), [3, 23])
+
+
+class MembershipSnapshotTestCase(TestCase):
+
+    def setUp(self):
+        self.snapshot = MembershipSnapshot.build(
+            [5, 3, 11], [(2, "alpha"), (1, "beta"), (3, "bravo")], {1: {3, 11, 99}, 2: {5}})
+
+    def test_build(self):
+        """
+        Test that rows are stored as immutable bitmaps for every group
+        """
+        self.assertEqual(self.snapshot.rows, {1: b"\x06", 2: b"\x01", 3: b"\x00"})
+
+    def test_apply(self):
+        """
+        Test that changes give a new snapshot, ignoring unknown groups and columns
+        """
+        changed = self.snapshot.apply([(1, 3, "remove"), (3, 5, "add"), (3, 11, "add"), (4, 5, "add"), (2, 99, "add")])
+        self.assertEqual(changed.rows, {1: b"\x04", 2: b"\x01", 3: b"\x05"})
+        self.assertEqual(self.snapshot.rows[1], b"\x06")
+        self.assertEqual(changed.groups, self.snapshot.groups)
+
+    def test_window(self):
+        self.assertEqual(self.snapshot.window(), [(2, "alpha"), (1, "beta"), (3, "bravo")])
+        self.assertEqual(self.snapshot.window("b"), [(1, "beta"), (3, "bravo")])
+        self.assertEqual(self.snapshot.window("b", 1, 5), [(3, "bravo")])
+        self.assertEqual(self.snapshot.window(offset=1, limit=1), [(1, "beta")])
+
+
+class ColumnIndexTestCase(TestCase):
+
+    def setUp(self):
+        self.permissions = [{"permission": Permission.objects.get(pk=pk)} for pk in self.pks()]
+        self.index = ColumnIndex(["module"], ["model"], self.permissions)
+
+    def pks(self):
+        return list(Permission.objects.values_list("pk", flat=True)[:3])[::-1]
+
+    def test_order(self):
+        """
+        Test that permission columns keep the order they were given in
+        """
+        self.assertEqual(self.index.permissions, tuple(self.permissions))
+        self.assertEqual(self.index.pks, tuple(self.pks()))
+
+    def test_positions(self):
+        """
+        Test the map of permission id to column position
+        """
+        for i, pk in enumerate(self.pks()):
+            self.assertEqual(self.index.position(pk), i)
+        self.assertEqual(self.index.position(-1), None)
+
+    def test_immutable(self):
+        """
+        Test that attributes of the index cannot be reassigned
+        """
+        with self.assertRaises(AttributeError):
+            self.index.permissions = ()
+
+    def test_shared_positions(self):
+        """
+        Test that a matrix built from the index shares its positions
+        """
+        matrix = PermissionMatrix(self.index.pks, self.index.positions)
+        self.assertTrue(matrix.positions is self.index.positions)
@@ -10,18 +10,75 @@ Tests for `django-permatrix` models module.
 
 from django.test import TestCase
 
-from permatrix.views import PermissionMatrixView
+from model_mommy import mommy
 
-class TestPermatrix(TestCase):
+from permatrix.bulk import PermissionChangeSet
+from permatrix.models import PermissionChange, JOURNAL_MAX_BATCH
+
+
+class TestPermissionChangeJournal(TestCase):
 
     def setUp(self):
-        pass
+        self.group = mommy.make("auth.Group")
+        self.other = mommy.make("auth.Group")
+        self.permission = mommy.make("auth.Permission")
+        self.second = mommy.make("auth.Permission")
+
+    def journal(self):
+        return [change.as_list() for change in PermissionChange.objects.all()]
+
+    def test_latest_seq_empty(self):
+        """
+        Test that the latest sequence number of an empty journal is 0
+        """
+        self.assertEqual(PermissionChange.objects.latest_seq(), 0)
+
+    def test_m2m_add_remove(self):
+        """
+        Test that adding and removing group permissions is journaled in order
+        """
+        self.group.permissions.add(self.permission)
+        self.group.permissions.remove(self.permission)
+        self.assertEqual(self.journal(), [
+            [self.group.pk, self.permission.pk, "add"],
+            [self.group.pk, self.permission.pk, "remove"],
+        ])
+        self.assertEqual(PermissionChange.objects.latest_seq(), PermissionChange.objects.last().pk)
+
+    def test_m2m_reverse(self):
+        """
+        Test that changes made from the permission side are journaled per group
+        """
+        self.permission.group_set.add(self.group, self.other)
+        self.assertEqual(sorted(self.journal()), sorted([
+            [self.group.pk, self.permission.pk, "add"],
+            [self.other.pk, self.permission.pk, "add"],
+        ]))
+
+    def test_m2m_clear(self):
+        """
+        Test that clearing a group's permissions journals each removal
+        """
+        self.group.permissions.add(self.permission, self.second)
+        PermissionChange.objects.all().delete()
+        self.group.permissions.clear()
+        self.assertEqual(sorted(self.journal()), sorted([
+            [self.group.pk, self.permission.pk, "remove"],
+            [self.group.pk, self.second.pk, "remove"],
+        ]))
 
-    # def test_all_modules_sorted(self):
-    #     PMV = PermissionMatrixView()
-    #     PMV.header_data = {"alpha": "first", "gamma": "last", "beta": "second"}
-    #     result = [x for x in PMV.all_modules()]
-    #     self.assertEqual(result, ["first", "second", "last"])
+    def test_change_set(self):
+        """
+        Test that change sets, which bypass m2m_changed, are journaled
+        """
+        changes = PermissionChangeSet([{"group": self.group.pk, "permission": self.permission.pk, "action": "add"}])
+        changes.is_valid()
+        changes.save()
+        self.assertEqual(self.journal(), [[self.group.pk, self.permission.pk, "add"]])
 
-    def tearDown(self):
-        pass
+    def test_large_batch_reset(self):
+        """
+        Test that a batch too large to journal is recorded as a reset
+        """
+        PermissionChange.objects.record([(1, 1, "add")] * (JOURNAL_MAX_BATCH + 1))
+        self.assertEqual(self.journal(), [[None, None, "reset"]])
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from unittest import skipIf
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase
+
+from model_mommy import mommy
+
+from permatrix.renderers import (get_renderer_class, DjangoTemplateRowRenderer, Jinja2RowRenderer, RowRenderer,
+                                 SlimRowRenderer)
+
+try:
+    import jinja2
+except ImportError:
+    jinja2 = None
+
+
+class GetRendererClassTestCase(TestCase):
+
+    def test_short_names(self):
+        """
+        Test looking up the built in renderers by short name
+        """
+        self.assertIs(get_renderer_class("python"), RowRenderer)
+        self.assertIs(get_renderer_class("django"), DjangoTemplateRowRenderer)
+        self.assertIs(get_renderer_class("jinja2"), Jinja2RowRenderer)
+        self.assertIs(get_renderer_class("slim"), SlimRowRenderer)
+
+    def test_dotted_path(self):
+        """
+        Test looking up a renderer class by dotted path
+        """
+        self.assertIs(get_renderer_class("permatrix.renderers.RowRenderer"), RowRenderer)
+
+    def test_unknown(self):
+        """
+        Test that an unknown renderer is a configuration error
+        """
+        with self.assertRaises(ImproperlyConfigured):
+            get_renderer_class("permatrix.renderers.Missing")
+
+
+class TemplateRowRendererTestCase(TestCase):
+    """
+    Template backends must render the same rows as the string builder
+    """
+    renderer_class = DjangoTemplateRowRenderer
+
+    def setUp(self):
+        content_type = mommy.make("contenttypes.ContentType", app_label="app")
+        self.permissions = [
+            {"permission": mommy.make("auth.Permission", content_type=content_type), "name": name}
+            for name in ("app.one", "app.<two>")
+        ]
+        self.group = mommy.make("auth.Group", name="<group>")
+
+    def assertSameRow(self, flags):
+        expected = RowRenderer(self.permissions).render(self.group, flags)
+        self.assertEqual(self.renderer_class(self.permissions).render(self.group, flags), expected)
+
+    def test_render(self):
+        """
+        Test rendering rows with granted and missing permissions
+        """
+        self.assertSameRow([True, False])
+        self.assertSameRow([False, True])
+
+    def test_render_no_columns(self):
+        """
+        Test rendering a row with no permission columns
+        """
+        self.permissions = []
+        self.assertSameRow([])
+
+
+@skipIf(jinja2 is None, "Jinja2 is not installed")
+class Jinja2RowRendererTestCase(TemplateRowRendererTestCase):
+    renderer_class = Jinja2RowRenderer
+
+
+class SlimRowRendererTestCase(TestCase):
+
+    def setUp(self):
+        content_type = mommy.make("contenttypes.ContentType", app_label="app")
+        self.permissions = [
+            {"permission": mommy.make("auth.Permission", content_type=content_type), "name": "app.perm{}".format(i)}
+            for i in range(20)
+        ]
+        self.group = mommy.make("auth.Group", name="<group>")
+
+    def test_render(self):
+        """
+        Test that group data is on the row and cells only carry grants
+        """
+        html = SlimRowRenderer(self.permissions[:3]).render(self.group, [True, False, False])
+        self.assertEqual(html, "<tr data-group_id='{}' data-group_name='&lt;group&gt;'><td>&lt;group&gt;</td>"
+                               "<td class='perm_yes'></td><td></td><td></td></tr>".format(self.group.pk))
+
+    def test_smaller(self):
+        """
+        Test that slim rows are a fraction of the size of full rows
+        """
+        flags = [i % 10 == 0 for i in range(20)]
+        full = RowRenderer(self.permissions).render(self.group, flags)
+        slim = SlimRowRenderer(self.permissions).render(self.group, flags)
+        self.assertLess(len(slim) * 5, len(full))
@@ -1,9 +1,34 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser, Group, Permission
+from django.core.cache import cache as django_cache
+from django.core.exceptions import PermissionDenied
+from django.db import connection, connections
+from django.http import StreamingHttpResponse
+from django.test import TestCase, TransactionTestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
 
-from permatrix.views import PermissionMatrixView
+from mock import patch
+from model_mommy import mommy
+
+from permatrix import cache
+from permatrix.bulk import PermissionChangeSet
+from permatrix.models import PermissionChange
+from permatrix.views import (GroupPermissionForm, PermissionMatrixView, PermissionMatrixDataView, PermissionRow,
+                             PermissionChangesView, PermissionColumnsView, PermissionHoldersView,
+                             PermissionMatrixExportView, UserPermissionMatrixView)
+
+from tests import StaffRequestFactory
+
+try:
+    from django.urls import reverse
+except ImportError:
+    from django.core.urlresolvers import reverse
+
+import base64
+import json
 
 
 class TestViewGenerators(TestCase):
@@ -110,4 +135,801 @@ class TestViewGenerators(TestCase):
         PMV.header_data = self.HEADER_DATA
         results = [list(PMV.all_permissions()) for i in range(10)]
         for i in results:
-            self.assertEqual(results[0], i)
\ No newline at end of file
+            self.assertEqual(results[0], i)
+
+
+class TestMembershipQueries(TestCase):
+    """
+    Test that the number of queries needed to render the matrix does not grow
+    with the number of groups
+    """
+
+    def setUp(self):
+        self.factory = StaffRequestFactory()
+        self.permissions = Permission.objects.all()[:3]
+
+    def make_groups(self, count):
+        for i in range(count):
+            group = mommy.make("auth.Group")
+            group.permissions.add(*self.permissions[:i % 3])
+
+    def test_get_memberships(self):
+        """
+        Test that memberships are mapped from group id to permission ids
+        """
+        group = mommy.make("auth.Group")
+        group.permissions.add(*self.permissions[:2])
+        PMV = PermissionMatrixView()
+        with self.assertNumQueries(1):
+            memberships = PMV.get_memberships()
+        self.assertEqual(memberships, {group.pk: {p.pk for p in self.permissions[:2]}})
+
+    def test_attach_groups_constant_queries(self):
+        """
+        Test that attach_groups uses the same number of queries for any number of groups
+        """
+        for count in (1, 10):
+            self.make_groups(count)
+            PMV = PermissionMatrixView()
+            PMV.build_headers(PMV.get_permissions())
+            with self.assertNumQueries(2):
+                PMV.attach_groups()
+
+    def test_get_constant_queries(self):
+        """
+        Test that rendering the page uses the same number of queries for any number of groups
+        """
+        view = PermissionMatrixView.as_view()
+        view(self.factory.get("/"))
+        self.make_groups(1)
+        with CaptureQueriesContext(connection) as small:
+            view(self.factory.get("/"))
+        self.make_groups(20)
+        with CaptureQueriesContext(connection) as large:
+            response = view(self.factory.get("/"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(small), len(large))
+
+
+class TestPermissionRows(TestCase):
+    """
+    Test rendering of group rows from the permission matrix
+    """
+
+    def setUp(self):
+        django_cache.clear()
+
+    def test_row_html(self):
+        """
+        Test that rendered cells reflect the group's permissions
+        """
+        has_perm, not_perm = Permission.objects.all()[:2]
+        group = mommy.make("auth.Group")
+        group.permissions.add(has_perm)
+        PMV = PermissionMatrixView()
+        PMV.build_headers(PMV.get_permissions())
+        PMV.attach_groups()
+        html = PMV.group_rows[0].html
+        self.assertEqual(html.count("<td "), Permission.objects.count())
+        cell = "<td data-group_id='{}' data-group_name='{}' data-permission_id='{}' data-permission_name='auth.{}'"
+        self.assertIn(cell.format(group.pk, group.name, has_perm.pk, has_perm.codename), html)
+        self.assertEqual(html.count("perm_yes"), 1)
+        self.assertTrue(PMV.matrix.has_perm(group.pk, has_perm.pk))
+        self.assertFalse(PMV.matrix.has_perm(group.pk, not_perm.pk))
+
+
+class TestBuildColumns(TestCase):
+    """
+    Test materialisation of the header tree into a column index
+    """
+
+    def test_columns_match_generators(self):
+        """
+        Test that the column index keeps the order of the header generators
+        """
+        PMV = PermissionMatrixView()
+        PMV.build_headers(PMV.get_permissions())
+        PMV.calculate_colspan()
+        columns = PMV.build_columns()
+        self.assertEqual(list(columns.modules), list(PMV.all_modules()))
+        self.assertEqual(list(columns.models), list(PMV.all_models()))
+        self.assertEqual(list(columns.permissions), list(PMV.all_permissions()))
+        self.assertEqual(sum(m["cell"].attr("colspan") for m in columns.modules), len(columns))
+
+    def test_columns_sorted_once(self):
+        """
+        Test that attaching groups does not walk the header tree again
+        """
+        mommy.make("auth.Group", _quantity=3)
+        PMV = PermissionMatrixView()
+        PMV.build_headers(PMV.get_permissions())
+        PMV.build_columns()
+        PMV.all_permissions = None
+        PMV.attach_groups()
+        self.assertEqual(len(PMV.group_rows), 3)
+
+
+class TestStreaming(TestCase):
+    """
+    Test the streaming mode of the matrix view
+    """
+
+    def setUp(self):
+        django_cache.clear()
+        self.factory = StaffRequestFactory()
+        permissions = Permission.objects.all()[:3]
+        for i in range(5):
+            group = mommy.make("auth.Group", name="group-{}".format(4 - i))
+            group.permissions.add(*permissions[:i % 3])
+
+    def test_streamed_rows(self):
+        """
+        Test that streamed rows match the rows of the rendered page, in order
+        """
+        rendered = PermissionMatrixView()
+        rendered.get_columns()
+        rendered.attach_groups()
+        expected = [row.html for row in rendered.group_rows]
+        django_cache.clear()
+        view = PermissionMatrixView(streaming=True, stream_chunk_size=2)
+        view.get_columns()
+        self.assertEqual(list(view.iter_rows()), expected)
+
+    def test_streaming_response(self):
+        """
+        Test that the streaming view sends the page around the rows
+        """
+        view = PermissionMatrixView.as_view(streaming=True)
+        response = view(self.factory.get("/"))
+        self.assertTrue(isinstance(response, StreamingHttpResponse))
+        parts = list(response.streaming_content)
+        self.assertEqual(len(parts), 7)
+        self.assertIn(b"module-row", parts[0])
+        self.assertIn(b"group-0", parts[1])
+        self.assertIn(b"group-4", parts[5])
+        self.assertIn(b"pending-actions", parts[-1])
+
+
+class TestDataView(TestCase):
+    """
+    Test the JSON matrix data view
+    """
+
+    def setUp(self):
+        django_cache.clear()
+        self.factory = StaffRequestFactory()
+        self.permissions = list(Permission.objects.all()[:10])
+        self.group = mommy.make("auth.Group")
+        self.group.permissions.add(self.permissions[0], self.permissions[9])
+
+    def get_data(self):
+        response = PermissionMatrixDataView.as_view()(self.factory.get("/data/"))
+        self.assertEqual(response["Content-Type"], "application/json")
+        return json.loads(response.content.decode("utf-8"))
+
+    def test_columns(self):
+        """
+        Test that the columns are listed once in matrix order
+        """
+        data = self.get_data()
+        PMV = PermissionMatrixView()
+        columns = PMV.get_columns()
+        self.assertEqual([p["id"] for p in data["permissions"]], list(columns.pks))
+        self.assertEqual(sum(m["colspan"] for m in data["modules"]), len(columns))
+        self.assertEqual(sum(m["colspan"] for m in data["models"]), len(columns))
+
+    def test_grants_bitmap(self):
+        """
+        Test that decoding a group's bitmap gives back its permissions
+        """
+        data = self.get_data()
+        group = data["groups"][0]
+        self.assertEqual(group["id"], self.group.pk)
+        bits = bytearray(base64.b64decode(group["grants"]))
+        granted = [p["id"] for i, p in enumerate(data["permissions"]) if bits[i >> 3] & (1 << (i & 7))]
+        self.assertEqual(sorted(granted), sorted([self.permissions[0].pk, self.permissions[9].pk]))
+
+    def test_rows_not_rendered(self):
+        """
+        Test that the data view neither renders nor caches row HTML
+        """
+        with patch.object(PermissionRow, "render") as render:
+            self.get_data()
+        self.assertFalse(render.called)
+        self.assertEqual(cache.row_cache_stats(), {"hits": 0, "misses": 0})
+
+    def test_client_render_page(self):
+        """
+        Test that client rendering leaves rows out of the page and points at the data view
+        """
+        response = PermissionMatrixView.as_view(client_render=True)(self.factory.get("/"))
+        content = response.content.decode("utf-8")
+        self.assertIn('data-matrix-url="{}"'.format(reverse("permatrix-data")), content)
+        self.assertNotIn("permission-cell", content)
+
+
+class TestWindowing(TestCase):
+    """
+    Test filtering of the matrix by app labels, group name prefix and page
+    """
+
+    def setUp(self):
+        django_cache.clear()
+        self.factory = StaffRequestFactory()
+        self.permission = Permission.objects.get(content_type__app_label="sites", codename="add_site")
+        for name in ("alpha-1", "alpha-2", "alpha-3", "beta-1"):
+            mommy.make("auth.Group", name=name).permissions.add(self.permission)
+
+    def get_view(self, query):
+        view = PermissionMatrixView()
+        view.request = self.factory.get("/", query)
+        view.read_filters(view.request)
+        view.get_columns()
+        view.attach_groups()
+        return view
+
+    def test_app_filter(self):
+        """
+        Test that only the columns of the requested apps are shown
+        """
+        view = self.get_view({"apps": "sites,contenttypes"})
+        self.assertEqual([m["ct"].app_label for m in view.columns.modules], ["contenttypes", "sites"])
+        self.assertEqual(set(view.columns.pks),
+                         set(Permission.objects.filter(content_type__app_label__in=["sites", "contenttypes"])
+                             .values_list("pk", flat=True)))
+        self.assertTrue(view.matrix.has_perm(view.group_rows[0].group.pk, self.permission.pk))
+
+    def test_app_filter_memberships(self):
+        """
+        Test that memberships outside the requested apps are not read
+        """
+        view = PermissionMatrixView()
+        view.read_filters(self.factory.get("/", {"apps": "auth"}))
+        self.assertEqual(view.get_memberships(), {})
+
+    def test_group_prefix(self):
+        """
+        Test filtering groups by name prefix
+        """
+        view = self.get_view({"group": "alpha"})
+        self.assertEqual([row.group.name for row in view.group_rows], ["alpha-1", "alpha-2", "alpha-3"])
+
+    def test_window(self):
+        """
+        Test selecting a page of groups with offset and limit
+        """
+        view = self.get_view({"offset": 1, "limit": 2})
+        self.assertEqual([row.group.name for row in view.group_rows], ["alpha-2", "alpha-3"])
+        self.assertEqual(len(view.matrix), 2)
+        urls = view.get_page_urls()
+        self.assertEqual(urls["previous_url"], "?offset=0&limit=2")
+        self.assertEqual(urls["next_url"], "?offset=3&limit=2")
+
+    def test_rows_cached_per_app_filter(self):
+        """
+        Test that rows rendered with different columns are cached separately
+        """
+        narrow = self.get_view({"apps": "sites"}).group_rows[0].html
+        full = self.get_view({}).group_rows[0].html
+        self.assertTrue(len(full) > len(narrow))
+        self.assertEqual(self.get_view({"apps": "sites"}).group_rows[0].html, narrow)
+
+    def test_invalidation_reaches_filtered_rows(self):
+        """
+        Test that changing a group invalidates its rows for every app filter
+        """
+        self.get_view({"apps": "sites"})
+        group = Group.objects.get(name="alpha-1")
+        with self.captureOnCommitCallbacks(execute=True):
+            group.permissions.remove(self.permission)
+        self.assertNotIn("perm_yes", self.get_view({"apps": "sites"}).group_rows[0].html)
+
+    def test_streaming_window(self):
+        """
+        Test that streamed rows follow the same filters
+        """
+        view = PermissionMatrixView(streaming=True)
+        view.read_filters(self.factory.get("/", {"group": "alpha", "limit": 2}))
+        view.get_columns()
+        self.assertEqual(len(list(view.iter_rows())), 2)
+
+
+class TestConditionalGet(TestCase):
+    """
+    Test ETag support of the matrix views
+    """
+
+    def setUp(self):
+        django_cache.clear()
+        self.factory = StaffRequestFactory()
+        self.group = mommy.make("auth.Group")
+        self.permission = Permission.objects.all()[0]
+        self.view = PermissionMatrixView.as_view()
+
+    def get(self, etag=None, **params):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        return self.view(self.factory.get("/", params, **headers))
+
+    def test_not_modified(self):
+        """
+        Test that an unchanged matrix returns 304 without reading the matrix
+        """
+        etag = self.get()["ETag"]
+        with self.assertNumQueries(0):
+            response = self.get(etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_changed_by_m2m(self):
+        """
+        Test that changing a group's permissions changes the ETag
+        """
+        etag = self.get()["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.permissions.add(self.permission)
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_changed_by_form(self):
+        """
+        Test that saving a permission form changes the ETag
+        """
+        etag = self.get()["ETag"]
+        form = GroupPermissionForm({"group": self.group.pk, "permission": self.permission.pk, "action": "add"})
+        form.is_valid()
+        with patch("permatrix.signals.groups_changed"):
+            with self.captureOnCommitCallbacks(execute=True):
+                form.save()
+        self.assertEqual(self.get(etag).status_code, 200)
+
+    def test_changed_by_bulk_post(self):
+        """
+        Test that applying a change set changes the ETag
+        """
+        etag = self.get()["ETag"]
+        changes = PermissionChangeSet([{"group": self.group.pk, "permission": self.permission.pk, "action": "add"}])
+        changes.is_valid()
+        with self.captureOnCommitCallbacks(execute=True):
+            changes.save()
+        self.assertEqual(self.get(etag).status_code, 200)
+
+    def test_varies_with_query(self):
+        """
+        Test that different windows of the matrix have different ETags
+        """
+        self.assertNotEqual(self.get()["ETag"], self.get(apps="auth")["ETag"])
+
+
+class TestChangesView(TestCase):
+    """
+    Test the view listing journaled permission changes
+    """
+
+    def setUp(self):
+        self.factory = StaffRequestFactory()
+        self.group = mommy.make("auth.Group")
+        self.permissions = Permission.objects.all()[:2]
+
+    def get(self, since):
+        response = PermissionChangesView.as_view()(self.factory.get("/changes/", {"since": since}))
+        return json.loads(response.content.decode("utf-8"))
+
+    def test_changes_since(self):
+        """
+        Test that only changes after the given sequence number are returned
+        """
+        self.group.permissions.add(self.permissions[0])
+        seq = PermissionChange.objects.latest_seq()
+        self.group.permissions.add(self.permissions[1])
+        data = self.get(seq)
+        self.assertEqual(data["changes"], [[self.group.pk, self.permissions[1].pk, "add"]])
+        self.assertEqual(data["seq"], PermissionChange.objects.latest_seq())
+        self.assertEqual(self.get(data["seq"]), {"seq": data["seq"], "changes": []})
+
+    def test_reset(self):
+        """
+        Test that clients are told to reload after a reset entry
+        """
+        PermissionChange.objects.create(action=PermissionChange.RESET)
+        self.assertTrue(self.get(0)["reset"])
+
+    def test_page_sequence(self):
+        """
+        Test that the page is rendered with the journal position it reflects
+        """
+        self.group.permissions.add(self.permissions[0])
+        response = PermissionMatrixView.as_view()(self.factory.get("/"))
+        self.assertIn('data-changes-seq="{}"'.format(PermissionChange.objects.latest_seq()),
+                      response.content.decode("utf-8"))
+
+
+class TestRendererSetting(TestCase):
+
+    def setUp(self):
+        django_cache.clear()
+
+    def test_row_renderer(self):
+        """
+        Test that the configured backend renders the rows
+        """
+        mommy.make("auth.Group", name="Renderer Group")
+        request = StaffRequestFactory().get("/")
+        response = PermissionMatrixView.as_view(row_renderer="django")(request)
+        self.assertContains(response, "<tr><td>Renderer Group</td>")
+        self.assertEqual(PermissionMatrixView.as_view(row_renderer="python")(request).content, response.content)
+
+    def test_row_variant(self):
+        """
+        Test that rows cached for one backend are not served for another
+        """
+        view = PermissionMatrixView(row_renderer="django")
+        self.assertNotEqual(view.row_variant(), PermissionMatrixView(row_renderer="python").row_variant())
+
+
+class TestUserMatrix(TestCase):
+    """
+    Test the effective permissions shown by the user matrix
+    """
+
+    def setUp(self):
+        django_cache.clear()
+        User = get_user_model()
+        permissions = list(Permission.objects.order_by("pk")[:4])
+        self.group = mommy.make("auth.Group")
+        self.group.permissions.add(permissions[0], permissions[1])
+        self.other_group = mommy.make("auth.Group")
+        self.other_group.permissions.add(permissions[2])
+        self.user = User.objects.create_user("user")
+        self.user.groups.add(self.group, self.other_group)
+        self.user.user_permissions.add(permissions[3])
+        self.superuser = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.inactive = User.objects.create_user("inactive", is_active=False)
+        self.inactive.groups.add(self.group)
+        self.factory = StaffRequestFactory()
+
+    def build(self, **params):
+        view = UserPermissionMatrixView()
+        view.request = self.factory.get("/", params)
+        view.read_filters(view.request)
+        view.get_columns()
+        view.attach_groups()
+        return view
+
+    def effective(self, view, user):
+        names = {p.pk: "{}.{}".format(p.content_type.app_label, p.codename)
+                 for p in Permission.objects.select_related("content_type")}
+        return {names[pk] for pk in view.matrix.permission_ids(user.pk)}
+
+    def test_effective_permissions(self):
+        """
+        Test that rows match the permissions Django grants each user
+        """
+        view = self.build()
+        for user in (self.user, self.superuser, self.inactive):
+            user = get_user_model().objects.get(pk=user.pk)
+            self.assertEqual(self.effective(view, user), user.get_all_permissions())
+        self.assertEqual(len(self.effective(view, self.superuser)), Permission.objects.count())
+
+    def test_constant_queries(self):
+        """
+        Test that the number of queries does not grow with the number of users
+        """
+        self.build()
+        with CaptureQueriesContext(connection) as queries:
+            self.build()
+        for i in range(5):
+            mommy.make(get_user_model()).groups.add(self.group)
+        with self.assertNumQueries(len(queries)):
+            view = self.build()
+        self.assertEqual(len(view.matrix), 8)
+
+    def test_group_parameter_ignored(self):
+        """
+        Test that a group prefix does not drop permissions from other groups
+        """
+        rows = self.build().matrix.rows
+        self.assertEqual(self.build(group="x").matrix.rows, rows)
+        self.assertEqual(self.effective(self.build(group="x"), self.user), self.user.get_all_permissions())
+
+    def test_windowed(self):
+        """
+        Test effective permissions of a window of users
+        """
+        view = self.build(user="us")
+        self.assertEqual(list(view.matrix), [self.user.pk])
+        self.assertEqual(self.effective(view, self.user), self.user.get_all_permissions())
+
+    def test_render(self):
+        """
+        Test that the page shows read only user rows
+        """
+        response = UserPermissionMatrixView.as_view()(self.factory.get("/"))
+        self.assertContains(response, "data-username='user'")
+        self.assertNotContains(response, "class='permission-cell")
+        self.assertNotContains(response, "pending-actions")
+
+    def test_no_lazy_modules(self):
+        """
+        Test that the user matrix renders every module and never loads group
+        columns into user rows
+        """
+        with patch.object(PermissionMatrixView, "default_apps", ["sites"]):
+            response = UserPermissionMatrixView.as_view()(self.factory.get("/"))
+        self.assertNotContains(response, "data-columns-url")
+        self.assertContains(response, "data-module='auth' class='user-permission-cell")
+        response = UserPermissionMatrixView.as_view()(self.factory.get("/", {"apps": "auth"}))
+        self.assertContains(response, 'data-module="auth" data-loaded="true" checked>')
+        self.assertNotContains(response, 'data-module="sites"')
+
+    def test_read_only(self):
+        """
+        Test that the user matrix can not be posted to
+        """
+        response = UserPermissionMatrixView.as_view()(self.factory.post("/", {"data": "[]"}))
+        self.assertEqual(response.status_code, 405)
+
+    def test_etag_changed_by_membership(self):
+        """
+        Test that changing a user's groups changes the ETag
+        """
+        view = UserPermissionMatrixView.as_view()
+        etag = view(self.factory.get("/"))["ETag"]
+        self.user.groups.remove(self.other_group)
+        response = view(self.factory.get("/", HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(response.status_code, 200)
+
+
+class TestHoldersView(TestCase):
+
+    def setUp(self):
+        django_cache.clear()
+        self.group = mommy.make("auth.Group", name="Editors")
+        self.group.permissions.add(Permission.objects.get(codename="add_group"))
+        self.user = get_user_model().objects.create_user("member")
+        self.user.groups.add(self.group)
+        self.factory = StaffRequestFactory()
+
+    def get(self, **params):
+        response = PermissionHoldersView.as_view()(self.factory.get("/", params))
+        return response.status_code, json.loads(response.content.decode("utf-8"))
+
+    def test_holders(self):
+        """
+        Test listing groups and users holding comma separated permissions
+        """
+        status, data = self.get(permission="auth.add_group,auth.change_group", match="all", users="1")
+        self.assertEqual(status, 200)
+        self.assertEqual(data["groups"], [])
+        status, data = self.get(permission=["auth.add_group", "auth.change_group"], users="1")
+        self.assertEqual(data["groups"], [{"id": self.group.pk, "name": "Editors"}])
+        self.assertEqual(data["users"], [{"id": self.user.pk, "username": "member"}])
+        self.assertEqual(data["permissions"], ["auth.add_group", "auth.change_group"])
+
+    def test_errors(self):
+        """
+        Test that missing and unknown permissions and bad matches are rejected
+        """
+        self.assertEqual(self.get()[0], 400)
+        self.assertEqual(self.get(permission="auth.add_group", match="some")[0], 400)
+        status, data = self.get(permission="auth.nope")
+        self.assertEqual(status, 400)
+        self.assertIn("auth.nope", data["errors"]["permission"][0])
+
+
+class TestAccess(TestCase):
+    """
+    Test that the matrix and its data, export, columns, changes, user and
+    holders endpoints are limited to staff users who can view groups and
+    users, and that changes need permission to change groups
+    """
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.views = [PermissionMatrixView, PermissionMatrixDataView, PermissionMatrixExportView,
+                      PermissionColumnsView, PermissionChangesView, UserPermissionMatrixView, PermissionHoldersView]
+        self.user = get_user_model().objects.create_user("staff", is_staff=True)
+
+    def get(self, view, user):
+        request = self.factory.get("/", {"permission": "auth.add_group"})
+        request.user = user
+        return view.as_view()(request)
+
+    def test_anonymous(self):
+        for view in self.views:
+            with self.assertRaises(PermissionDenied):
+                self.get(view, AnonymousUser())
+
+    def test_permissions_required(self):
+        """
+        Test that staff users need the view permissions, and non staff users
+        are refused whatever they hold
+        """
+        for view in self.views:
+            with self.assertRaises(PermissionDenied):
+                self.get(view, get_user_model().objects.get(pk=self.user.pk))
+        self.user.user_permissions.add(*Permission.objects.filter(codename__in=["view_group", "view_user"]))
+        for view in self.views:
+            self.assertEqual(self.get(view, get_user_model().objects.get(pk=self.user.pk)).status_code, 200)
+        self.user.is_staff = False
+        self.user.save()
+        for view in self.views:
+            with self.assertRaises(PermissionDenied):
+                self.get(view, get_user_model().objects.get(pk=self.user.pk))
+
+    def test_post(self):
+        """
+        Test that posting changes needs permission to change groups as well
+        """
+        group = mommy.make("auth.Group")
+        self.user.user_permissions.add(*Permission.objects.filter(codename__in=["view_group", "view_user"]))
+        data = json.dumps([{"group": group.pk, "permission": Permission.objects.all()[0].pk, "action": "add"}])
+
+        def post(user):
+            request = self.factory.post("/", {"data": data})
+            request.user = user
+            return PermissionMatrixView.as_view()(request)
+        with self.assertRaises(PermissionDenied):
+            post(AnonymousUser())
+        with self.assertRaises(PermissionDenied):
+            post(get_user_model().objects.get(pk=self.user.pk))
+        self.assertFalse(group.permissions.exists())
+        self.user.user_permissions.add(Permission.objects.get(codename="change_group"))
+        self.assertEqual(post(get_user_model().objects.get(pk=self.user.pk)).status_code, 200)
+        self.assertTrue(group.permissions.exists())
+
+
+class TestLazyModules(TestCase):
+    """
+    Test opening the page with some modules and loading others later
+    """
+
+    def setUp(self):
+        django_cache.clear()
+        self.factory = StaffRequestFactory()
+        permissions = Permission.objects.order_by("pk")
+        for i in range(3):
+            group = mommy.make("auth.Group", name="group-{}".format(i))
+            group.permissions.add(*permissions[i::3])
+
+    def test_default_apps(self):
+        """
+        Test that only the default apps are rendered, with every module listed
+        """
+        response = PermissionMatrixView.as_view(default_apps=["auth"])(self.factory.get("/"))
+        self.assertContains(response, "data-module='auth' class='permission-cell")
+        self.assertNotContains(response, "data-module='contenttypes' class='permission-cell")
+        self.assertContains(response, 'data-module="contenttypes">')
+        self.assertContains(response, 'data-module="auth" data-loaded="true" checked>')
+
+    def test_apps_parameter_overrides_default(self):
+        response = PermissionMatrixView.as_view(default_apps=["auth"])(self.factory.get("/", {"apps": "contenttypes"}))
+        self.assertContains(response, "data-module='contenttypes' class='permission-cell")
+
+    def test_columns(self):
+        """
+        Test that module columns match the cells of the full page
+        """
+        params = {"group": "group-", "limit": 2}
+        response = PermissionColumnsView.as_view()(self.factory.get("/", dict(params, apps="contenttypes")))
+        data = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(data["modules"], ["contenttypes"])
+        full = PermissionMatrixView()
+        full.request = self.factory.get("/", params)
+        full.read_filters(full.request)
+        full.get_columns()
+        full.attach_groups()
+        self.assertEqual(data["groups"], [row.group.pk for row in full.group_rows])
+        for cells, row in zip(data["rows"], full.group_rows):
+            self.assertIn(cells, row.html)
+            self.assertIn("data-module='contenttypes'", cells)
+        self.assertIn(data["header"]["permissions"], "".join(node["html"] for node in full.columns.permissions))
+
+    def test_columns_url(self):
+        """
+        Test that the page links to the columns of its own window of groups
+        """
+        response = PermissionMatrixView.as_view()(self.factory.get("/", {"apps": "auth", "limit": 2}))
+        self.assertContains(response, 'data-columns-url="{}?limit=2"'.format(reverse("permatrix-columns")))
+
+
+class TestSlimCells(TestCase):
+
+    def setUp(self):
+        django_cache.clear()
+        self.group = mommy.make("auth.Group", name="Slim")
+        self.permission = Permission.objects.get(codename="add_group")
+        self.group.permissions.add(self.permission)
+        self.factory = StaffRequestFactory()
+
+    def test_page(self):
+        """
+        Test that slim pages mark the container and put ids on rows and headers
+        """
+        response = PermissionMatrixView.as_view(row_renderer="slim")(self.factory.get("/"))
+        self.assertContains(response, "permatrix-container slim-cells")
+        self.assertContains(response, "<tr data-group_id='{}' data-group_name='Slim'>".format(self.group.pk))
+        self.assertContains(response, "data-permission_id='{}'".format(self.permission.pk), count=1)
+        self.assertContains(response, "data-permission_name='auth.add_group'", count=1)
+        self.assertContains(response, "<td class='perm_yes'></td>", count=1)
+        self.assertNotContains(response, "permission-cell")
+
+    def test_columns(self):
+        """
+        Test that lazily loaded columns use slim cells
+        """
+        response = PermissionColumnsView.as_view(row_renderer="slim")(self.factory.get("/", {"apps": "auth"}))
+        data = json.loads(response.content.decode("utf-8"))
+        self.assertIn("<td class='perm_yes'></td>", data["rows"][0])
+        self.assertNotIn("data-", data["rows"][0])
+
+
+class TestReadDatabase(TransactionTestCase):
+    """
+    Test routing matrix reads to a read replica. The replica mirrors the test
+    database over a separate connection, so data must be committed to be seen
+    """
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        django_cache.clear()
+        self.group = mommy.make("auth.Group", name="Replica")
+        self.permission = Permission.objects.get(codename="add_group")
+        self.factory = StaffRequestFactory()
+        self.view = PermissionMatrixView.as_view(read_database="replica")
+
+    def test_reads_replica(self):
+        """
+        Test that GET reads the permissions, groups and memberships from the
+        read database
+        """
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            with CaptureQueriesContext(connection) as default:
+                response = self.view(self.factory.get("/"))
+        self.assertEqual(response.status_code, 200)
+        tables = " ".join(query["sql"] for query in replica.captured_queries)
+        for table in ("auth_permission", "auth_group", "auth_group_permissions", "permatrix_permissionchange"):
+            self.assertIn('"{}"'.format(table), tables)
+        self.assertEqual(len(default), 0)
+
+    def test_post_sticks_to_default(self):
+        """
+        Test that changes are written to the default database and the client
+        then reads from it
+        """
+        data = json.dumps([{"group": self.group.pk, "permission": self.permission.pk, "action": "add"}])
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            response = self.view(self.factory.post("/", {"data": data}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(replica), 0)
+        cookie = response.cookies["permatrix_primary"]
+        self.assertEqual(cookie["max-age"], 10)
+
+        request = self.factory.get("/")
+        request.COOKIES["permatrix_primary"] = cookie.value
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            response = self.view(request)
+        self.assertEqual(len(replica), 0)
+        self.assertContains(response, "data-group_name='Replica' data-permission_id='{}' data-permission_name="
+                                      "'auth.add_group' data-module='auth' class='permission-cell perm_yes'"
+                            .format(self.permission.pk))
+
+    def test_no_etag(self):
+        """
+        Test that pages read from the replica are never validated by ETag, as
+        the replica may still hold data older than the version counters
+        """
+        response = self.view(self.factory.get("/"))
+        self.assertFalse(response.has_header("ETag"))
+        etag = PermissionMatrixView.as_view()(self.factory.get("/"))["ETag"]
+        self.assertEqual(self.view(self.factory.get("/", HTTP_IF_NONE_MATCH=etag)).status_code, 200)
+
+    def test_separate_row_cache(self):
+        """
+        Test that rows read from the replica are cached apart from rows read
+        from the default database
+        """
+        view = PermissionMatrixView()
+        self.assertNotEqual(view.row_variant(), PermissionMatrixView(database="replica").row_variant())
+        self.assertIsNone(view.cache_timeout)
+        self.assertEqual(PermissionMatrixView(database="replica").cache_timeout, 10)